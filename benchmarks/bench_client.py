@@ -0,0 +1,123 @@
+import argparse
+import asyncio
+import json
+import pathlib
+import time
+
+from aiohttp import web
+
+from dashed import metrics
+from dashed.discord import DiscordAPIClient
+from dashed.fake_discord import FakeDiscord, FakeDiscordConfig
+from dashed.streaming import ResponseStream
+
+
+async def run(args):
+    fake = FakeDiscord(
+        FakeDiscordConfig(
+            latency=args.latency,
+            jitter=args.jitter,
+            webhook_limit=args.webhook_limit,
+            webhook_window=args.webhook_window,
+        )
+    )
+    runner = web.AppRunner(fake.application())
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", args.port)
+    await site.start()
+
+    client = DiscordAPIClient(
+        token="benchmark", base_url=f"http://127.0.0.1:{args.port}/api/v8"
+    )
+
+    # Every interaction gets its own webhook bucket, so spread the updates
+    # over a number of interactions like a burst of deferred commands would.
+    async def interaction(index: int):
+        for update in range(args.updates):
+            await client.edit_original_interaction_response(
+                "1", f"token-{index}", {"content": f"update {update}"}
+            )
+            await asyncio.sleep(args.progress_interval)
+
+    # With --stream, progress goes through a coalescing stream instead and
+    # only the latest state is sent at the stream's cadence.
+    async def streamed_interaction(index: int):
+        stream = ResponseStream(
+            lambda body: client.edit_original_interaction_response(
+                "1", f"token-{index}", body
+            ),
+            lambda: client.edit_original_interaction_response_delay(
+                "1", f"token-{index}"
+            ),
+            interval=args.stream_interval,
+        )
+        async with stream:
+            for update in range(args.updates):
+                stream.push({"content": f"update {update}"})
+                await asyncio.sleep(args.progress_interval)
+        assert fake.messages[f"token-{index}"]["content"] == (
+            f"update {args.updates - 1}"
+        )
+
+    started = time.perf_counter()
+    target = streamed_interaction if args.stream else interaction
+    await asyncio.gather(*(target(index) for index in range(args.interactions)))
+    elapsed = time.perf_counter() - started
+
+    await client.close()
+    await runner.cleanup()
+
+    total = args.interactions * args.updates
+    stats = client.ratelimiter.stats
+    return {
+        "updates": total,
+        "elapsed_seconds": elapsed,
+        "updates_per_second": total / elapsed,
+        "server_requests": fake.stats.requests,
+        "server_rate_limited": fake.stats.rate_limited,
+        "client_waits": stats.waits,
+        "client_wait_seconds": stats.wait_seconds,
+        "client_max_wait_seconds": stats.max_wait_seconds,
+        "client_rate_limited": stats.rate_limited,
+        "api_latency_count": sum(
+            histogram.count for histogram in metrics.API_LATENCY._values.values()
+        ),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser("bench_client")
+    parser.add_argument("--interactions", default=200, type=int)
+    parser.add_argument("--updates", default=10, type=int)
+    parser.add_argument(
+        "--progress-interval",
+        default=0.0,
+        type=float,
+        help="Seconds between progress updates produced by each interaction",
+    )
+    parser.add_argument(
+        "--stream", action="store_true", help="Send updates through a ResponseStream"
+    )
+    parser.add_argument("--stream-interval", default=1.0, type=float)
+    parser.add_argument("--latency", default=0.05, type=float)
+    parser.add_argument("--jitter", default=0.02, type=float)
+    parser.add_argument("--webhook-limit", default=5, type=int)
+    parser.add_argument("--webhook-window", default=2.0, type=float)
+    parser.add_argument("--port", default=8691, type=int)
+    parser.add_argument("--output", type=pathlib.Path, help="Write results as JSON")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    for key, value in results.items():
+        print(
+            f"{key:>24}: {value:.2f}"
+            if isinstance(value, float)
+            else f"{key:>24}: {value}"
+        )
+
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,270 @@
+import argparse
+import asyncio
+import contextlib
+import json
+import pathlib
+import platform
+import statistics
+import time
+from typing import Any, Dict, List
+
+from aiohttp import web
+from aiohttp.test_utils import TestClient, TestServer
+from nacl.signing import SigningKey
+
+from dashed import codec, metrics, server
+from dashed.loader import DashedContext, load_from_file
+from dashed.verify import SignatureVerifier
+
+ROOT = pathlib.Path(__file__).parent.parent
+MODULES = [
+    ROOT / "example" / "echo.py",
+    ROOT / "example" / "math.py",
+    ROOT / "benchmarks" / "workload.py",
+]
+
+_USER = {
+    "id": "80351110224678912",
+    "username": "Nelly",
+    "discriminator": "1337",
+    "avatar": "8342729096ea3675442027381ff50dfe",
+    "public_flags": 64,
+}
+_CHANNEL = {"id": "41771983423143937", "name": "general", "permissions": "0", "type": 0}
+
+
+def _command(name: str, options=None, resolved=None) -> Dict[str, Any]:
+    data = {"id": "1", "name": name, "options": options or []}
+    if resolved is not None:
+        data["resolved"] = resolved
+    return data
+
+
+SCENARIOS = {
+    "plain": _command("echo", [{"name": "message", "type": 3, "value": "hello world"}]),
+    "group": _command(
+        "math",
+        [
+            {
+                "name": "config",
+                "type": 2,
+                "options": [
+                    {
+                        "name": "set",
+                        "type": 1,
+                        "options": [
+                            {"name": "key", "type": 3, "value": "precision"},
+                            {"name": "value", "type": 3, "value": "2"},
+                        ],
+                    }
+                ],
+            }
+        ],
+    ),
+    "resolved": _command(
+        "compare",
+        [
+            {"name": "first", "type": 6, "value": _USER["id"]},
+            {"name": "second", "type": 6, "value": "80351110224678913"},
+            {"name": "channel", "type": 7, "value": _CHANNEL["id"]},
+        ],
+        resolved={
+            "users": {
+                _USER["id"]: _USER,
+                "80351110224678913": dict(_USER, id="80351110224678913"),
+            },
+            "members": {
+                _USER["id"]: {
+                    "nick": None,
+                    "roles": [],
+                    "joined_at": "2021-01-01T00:00:00.000000+00:00",
+                    "permissions": "2147483647",
+                    "pending": False,
+                }
+            },
+            "channels": {_CHANNEL["id"]: _CHANNEL},
+        },
+    ),
+    "embeds": _command("leaderboard"),
+    "component": {"custom_id": "vote:1234:yes", "component_type": 2},
+    "autocomplete": _command(
+        "play", [{"name": "song", "type": 3, "value": "song 1", "focused": True}]
+    ),
+    "deferred": _command("later"),
+}
+
+
+def _interaction_type(data: Dict[str, Any]) -> int:
+    if "custom_id" in data:
+        return 3
+    elif any(option.get("focused") for option in data.get("options", [])):
+        return 4
+    return 2
+
+
+class _NullAPIClient:
+    async def edit_original_interaction_response(self, *args, **kwargs):
+        return {}
+
+    async def close(self):
+        pass
+
+
+def _percentiles(samples: List[float]) -> Dict[str, float]:
+    if len(samples) < 2:
+        value = samples[0] * 1000 if samples else 0.0
+        return {"p50_ms": value, "p99_ms": value}
+
+    quantiles = statistics.quantiles(samples, n=100)
+    return {"p50_ms": quantiles[49] * 1000, "p99_ms": quantiles[98] * 1000}
+
+
+@contextlib.contextmanager
+def _record_stages(stages: Dict[str, List[float]]):
+    # Keep the raw stage timings for exact percentiles, the histograms
+    # themselves only have bucket resolution.
+    stage_observe = metrics.STAGE_LATENCY.observe
+    command_observe = metrics.COMMAND_LATENCY.observe
+
+    def record_stage(value, **labels):
+        stages.setdefault(labels["stage"], []).append(value)
+        stage_observe(value, **labels)
+
+    def record_command(value, **labels):
+        stages.setdefault("handler", []).append(value)
+        command_observe(value, **labels)
+
+    metrics.STAGE_LATENCY.observe = record_stage
+    metrics.COMMAND_LATENCY.observe = record_command
+    try:
+        yield
+    finally:
+        metrics.STAGE_LATENCY.observe = stage_observe
+        metrics.COMMAND_LATENCY.observe = command_observe
+
+
+def _sign(key: SigningKey, payload: Dict[str, Any]) -> Dict[str, Any]:
+    body = codec.dumps(payload)
+    timestamp = str(int(time.time()))
+    return {
+        "body": body,
+        "headers": {
+            "X-Signature-Ed25519": key.sign(timestamp.encode() + body).signature.hex(),
+            "X-Signature-Timestamp": timestamp,
+            "Content-Type": "application/json",
+        },
+    }
+
+
+async def _run_scenario(client, key, name, command_data, requests, concurrency):
+    signed = [
+        _sign(
+            key,
+            {
+                "id": str(index),
+                "application_id": "1",
+                "token": f"token-{index}",
+                "type": _interaction_type(command_data),
+                "data": command_data,
+            },
+        )
+        for index in range(requests)
+    ]
+
+    stages: Dict[str, List[float]] = {}
+    latencies = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def send(request):
+        async with semaphore:
+            started = time.perf_counter()
+            response = await client.post(
+                "/interactions", data=request["body"], headers=request["headers"]
+            )
+            await response.read()
+            latencies.append(time.perf_counter() - started)
+            assert response.status == 200, f"{name}: {response.status}"
+
+    with _record_stages(stages):
+        started = time.perf_counter()
+        await asyncio.gather(*(send(request) for request in signed))
+        elapsed = time.perf_counter() - started
+
+    return {
+        "requests": requests,
+        "concurrency": concurrency,
+        "throughput_rps": requests / elapsed,
+        "latency": _percentiles(latencies),
+        "stages": {stage: _percentiles(values) for stage, values in stages.items()},
+    }
+
+
+async def run(args) -> Dict[str, Any]:
+    key = SigningKey.generate()
+    modules = [await load_from_file(path) for path in MODULES]
+
+    ctx = DashedContext(
+        client=_NullAPIClient(),
+        application_key=None,
+        verifier=SignatureVerifier(key.verify_key.encode(), backend=args.backend),
+        commands={c.name: c for module in modules for c in module.commands},
+        groups={g.name: g for module in modules for g in module.groups},
+        components={c.pattern: c for module in modules for c in module.components},
+    )
+
+    app = web.Application()
+    app["ctx"] = ctx
+    app.add_routes([web.post("/interactions", server.handle_interactions_request)])
+
+    results = {}
+    async with TestClient(TestServer(app)) as client:
+        for name in args.scenario or SCENARIOS:
+            # Warm up connections and code paths before measuring
+            await _run_scenario(
+                client, key, name, SCENARIOS[name], args.concurrency, args.concurrency
+            )
+            results[name] = await _run_scenario(
+                client, key, name, SCENARIOS[name], args.requests, args.concurrency
+            )
+
+            result = results[name]
+            print(
+                f"{name:>10}: {result['throughput_rps']:8.0f} req/s  "
+                f"p50 {result['latency']['p50_ms']:.2f}ms  "
+                f"p99 {result['latency']['p99_ms']:.2f}ms"
+            )
+            for stage, values in result["stages"].items():
+                print(
+                    f"{'':>12}{stage:>10}: p50 {values['p50_ms']:.3f}ms  "
+                    f"p99 {values['p99_ms']:.3f}ms"
+                )
+
+    await ctx.scheduler.drain(10)
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "json_backend": codec.backend,
+        "verify_backend": ctx.verifier.backend.name,
+        "scenarios": results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser("bench_interactions")
+    parser.add_argument("--requests", default=2000, type=int)
+    parser.add_argument("--concurrency", default=32, type=int)
+    parser.add_argument(
+        "--scenario", action="append", choices=list(SCENARIOS), help="Scenarios to run"
+    )
+    parser.add_argument("--backend", default="auto", help="Verification backend")
+    parser.add_argument("--output", type=pathlib.Path, help="Write results as JSON")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2))
+        print(f"Wrote results to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+import argparse
+import dataclasses
+import timeit
+import tracemalloc
+
+from dashed.discord import Channel, ChannelType, User
+from dashed.loader import _resolve_channel, _resolve_user
+
+_RESOLVED = {
+    "users": {
+        str(i): {
+            "id": str(i),
+            "username": f"user-{i}",
+            "discriminator": "0001",
+            "avatar": "8342729096ea3675442027381ff50dfe",
+            "public_flags": 0,
+        }
+        for i in range(4)
+    },
+    "members": {
+        str(i): {"nick": None, "roles": [], "joined_at": "2021-01-01T00:00:00"}
+        for i in range(4)
+    },
+    "channels": {
+        "10": {"id": "10", "name": "general", "permissions": "0", "type": 0},
+        "11": {"id": "11", "name": "random", "permissions": "0", "type": 0},
+    },
+}
+
+
+# The eager dataclasses resolved options used to be built from
+@dataclasses.dataclass
+class DataclassChannel:
+    id: str
+    name: str
+    permissions: str
+    type: ChannelType
+
+
+@dataclasses.dataclass
+class DataclassUser:
+    id: str
+    username: str
+    discriminator: str
+    public_flags: int
+    avatar: str
+    bot: bool = False
+
+
+def _dataclass_options():
+    return [DataclassUser(**_RESOLVED["users"][str(i)]) for i in range(4)] + [
+        DataclassChannel(**_RESOLVED["channels"][c]) for c in ("10", "11")
+    ]
+
+
+def _view_options():
+    return [_resolve_user(_RESOLVED, str(i)) for i in range(4)] + [
+        _resolve_channel(_RESOLVED, c) for c in ("10", "11")
+    ]
+
+
+def _use(options):
+    # Handlers typically only touch a field or two
+    return [option.id for option in options]
+
+
+def _memory(factory, count: int) -> float:
+    tracemalloc.start()
+    objects = [factory() for _ in range(count)]
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del objects
+    return size / count
+
+
+def main():
+    parser = argparse.ArgumentParser("bench_resolved")
+    parser.add_argument("--number", default=20000, type=int)
+    args = parser.parse_args()
+
+    assert isinstance(_view_options()[0], User)
+    assert isinstance(_view_options()[-1], Channel)
+
+    for name, factory in (("dataclass", _dataclass_options), ("view", _view_options)):
+        seconds = min(
+            timeit.repeat(lambda: _use(factory()), number=args.number, repeat=5)
+        )
+        print(
+            f"{name:>10}: {seconds / args.number * 1e6:.2f}us per request "
+            f"(4 users, 2 channels), {_memory(factory, 1000):.0f} bytes retained"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+import argparse
+import dataclasses
+import timeit
+
+from dashed.discord import ApplicationCommandCallbackData
+from dashed.embeds import Embed, EmbedField, EmbedThumbnail
+from dashed.serialize import encode
+
+
+def _leaderboard_reply(embed_count: int, field_count: int):
+    return ApplicationCommandCallbackData(
+        content="Leaderboard",
+        embeds=[
+            Embed(
+                title=f"Page {page}",
+                description="Top players this week",
+                color=0x5865F2,
+                thumbnail=EmbedThumbnail(url="https://example.com/thumb.png"),
+                fields=[
+                    EmbedField(name=f"#{rank}", value=f"player-{rank}", inline=True)
+                    for rank in range(field_count)
+                ],
+            )
+            for page in range(embed_count)
+        ],
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser("bench_serialize")
+    parser.add_argument("--embeds", default=10, type=int)
+    parser.add_argument("--fields", default=25, type=int)
+    parser.add_argument("--number", default=2000, type=int)
+    args = parser.parse_args()
+
+    reply = _leaderboard_reply(args.embeds, args.fields)
+
+    results = {}
+    for name, fn in (("asdict", dataclasses.asdict), ("encode", encode)):
+        seconds = min(timeit.repeat(lambda: fn(reply), number=args.number, repeat=5))
+        results[name] = seconds / args.number * 1e6
+        print(f"{name:>8}: {results[name]:.1f}us per reply")
+
+    print(f" speedup: {results['asdict'] / results['encode']:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
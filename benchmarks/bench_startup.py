@@ -0,0 +1,94 @@
+import argparse
+import asyncio
+import pathlib
+import tempfile
+import time
+
+from dashed.loader import collect_modules, load_from_file, load_modules
+from dashed.manifest import load_manifest, write_manifest
+
+MODULE_TEMPLATE = """
+import asyncio
+import time
+
+import dashed
+
+# Stand in for heavy imports (clients, ORMs, ML models...)
+time.sleep({import_delay})
+
+
+async def initialize():
+    # Stand in for warming caches or connecting to a database
+    await asyncio.sleep({initialize_delay})
+
+
+@dashed.command(description="Command {index}")
+async def command_{index}(ctx: dashed.InteractionContext, value: str, count: int = 1):
+    return ctx.reply(content=value * count)
+
+
+group_{index} = dashed.Group(name="group-{index}", description="Group {index}")
+
+
+@group_{index}.command(description="Subcommand")
+async def sub(ctx: dashed.DeferredInteractionContext, user: dashed.User):
+    await ctx.update(content=user.mention())
+"""
+
+
+def _write_modules(directory: pathlib.Path, args) -> list:
+    paths = []
+    for index in range(args.modules):
+        path = directory / f"module_{index}.py"
+        path.write_text(
+            MODULE_TEMPLATE.format(
+                index=index,
+                import_delay=args.import_delay,
+                initialize_delay=args.initialize_delay,
+            )
+        )
+        paths.append(path)
+    return paths
+
+
+async def _sequential(paths):
+    return [await load_from_file(path) for path in paths]
+
+
+async def run(args):
+    with tempfile.TemporaryDirectory() as directory:
+        directory = pathlib.Path(directory)
+        paths = _write_modules(directory, args)
+        manifest = directory / "manifest.json"
+
+        results = {}
+        for name, load in (
+            ("sequential", _sequential),
+            ("concurrent", load_modules),
+        ):
+            started = time.perf_counter()
+            modules = await load(paths)
+            results[name] = time.perf_counter() - started
+
+        write_manifest(manifest, modules)
+        started = time.perf_counter()
+        lazy = load_manifest(manifest, paths)
+        assert len(lazy) == len(paths)
+        collect_modules(lazy.values())
+        results["manifest"] = time.perf_counter() - started
+
+        for name, elapsed in results.items():
+            print(f"{name:>12}: {elapsed:.3f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser("bench_startup")
+    parser.add_argument("--modules", default=40, type=int)
+    parser.add_argument("--import-delay", default=0.01, type=float)
+    parser.add_argument("--initialize-delay", default=0.1, type=float)
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+import argparse
+import os
+import time
+import timeit
+
+from nacl.signing import SigningKey
+
+from dashed.verify import BACKENDS, SIGNATURE_SIZE
+
+
+def main():
+    parser = argparse.ArgumentParser("bench_verify")
+    parser.add_argument(
+        "--sizes",
+        default="512,16384,262144",
+        help="Comma separated body sizes (in bytes) to benchmark",
+    )
+    parser.add_argument("--number", default=500, type=int)
+    args = parser.parse_args()
+
+    key = SigningKey.generate()
+    public_key = key.verify_key.encode()
+
+    backends = {}
+    for name, backend_type in BACKENDS.items():
+        try:
+            backends[name] = backend_type(public_key)
+        except ImportError:
+            print(f"{name}: not installed, skipping")
+
+    for size in [int(size) for size in args.sizes.split(",")]:
+        timestamp = str(int(time.time())).encode("ascii")
+        body = os.urandom(size)
+        signature = key.sign(timestamp + body).signature
+        signed = bytearray(signature + timestamp + body)
+        assert len(signature) == SIGNATURE_SIZE
+
+        # What the interactions handler used to do for every request
+        def baseline():
+            key.verify_key.verify(timestamp + body, signature)
+
+        results = {"baseline": baseline}
+        for name, backend in backends.items():
+            results[name] = lambda backend=backend: backend.verify(signed)
+
+        print(f"body size {size} bytes:")
+        for name, fn in results.items():
+            seconds = min(timeit.repeat(fn, number=args.number, repeat=5))
+            print(f"  {name:>12}: {seconds / args.number * 1e6:.1f}us per request")
+
+
+if __name__ == "__main__":
+    main()
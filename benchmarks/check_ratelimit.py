@@ -0,0 +1,59 @@
+import argparse
+import asyncio
+import sys
+
+from aiohttp import web
+
+from dashed.discord import DiscordAPIClient
+from dashed.fake_discord import FakeDiscord, FakeDiscordConfig
+from dashed.ratelimit import RateLimiter
+
+
+async def run(args) -> bool:
+    fake = FakeDiscord(FakeDiscordConfig(latency=0, jitter=0))
+    runner = web.AppRunner(fake.application())
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", args.port)
+    await site.start()
+
+    # A global limit of one request per second makes the second request
+    # wait for the global slot while it is probing its (new) guild bucket.
+    client = DiscordAPIClient(
+        token="check",
+        base_url=f"http://127.0.0.1:{args.port}/api/v8",
+        ratelimiter=RateLimiter(global_limit=1),
+    )
+    try:
+        await client.get_guild_application_commands("1", "1")
+        try:
+            await asyncio.wait_for(client.get_guild_application_commands("1", "2"), 0.1)
+        except asyncio.TimeoutError:
+            pass
+
+        # The cancelled request must not leave its bucket waiting for
+        # headers that will never come.
+        try:
+            await asyncio.wait_for(
+                client.get_guild_application_commands("1", "2"), args.timeout
+            )
+        except asyncio.TimeoutError:
+            print("A request cancelled in the global wait blocked its bucket")
+            return False
+        print("A request cancelled in the global wait released its bucket")
+        return True
+    finally:
+        await client.close()
+        await runner.cleanup()
+
+
+def main():
+    parser = argparse.ArgumentParser("check_ratelimit")
+    parser.add_argument("--port", default=8692, type=int)
+    parser.add_argument("--timeout", default=5.0, type=float)
+    args = parser.parse_args()
+    if not asyncio.run(run(args)):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
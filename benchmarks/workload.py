@@ -0,0 +1,86 @@
+import asyncio
+
+import dashed
+from dashed.embeds import EmbedThumbnail
+
+
+@dashed.command(description="Return a page of leaderboard embeds")
+async def leaderboard(ctx: dashed.InteractionContext):
+    return ctx.reply(
+        content="Leaderboard",
+        embeds=[
+            dashed.Embed(
+                title=f"Page {page}",
+                description="Top players this week",
+                color=0x5865F2,
+                thumbnail=EmbedThumbnail(url="https://example.com/thumb.png"),
+                fields=[
+                    dashed.EmbedField(
+                        name=f"#{rank}", value=f"player-{rank}", inline=True
+                    )
+                    for rank in range(25)
+                ],
+            )
+            for page in range(10)
+        ],
+    )
+
+
+@dashed.command(description="Compare two users")
+async def compare(
+    ctx: dashed.InteractionContext,
+    first: dashed.User,
+    second: dashed.User,
+    channel: dashed.Channel,
+):
+    return ctx.reply(content=f"{first.mention()} vs {second.mention()}")
+
+
+@dashed.command(description="Deferred without any work")
+async def later(ctx: dashed.DeferredInteractionContext):
+    await ctx.update(content="done")
+
+
+@dashed.component("vote:{poll_id}:{choice}")
+async def vote(ctx: dashed.ComponentContext, poll_id: int, choice: str):
+    return ctx.update(
+        content=f"Voted {choice} on poll {poll_id}",
+        components=[
+            dashed.ActionRow(
+                [
+                    dashed.Button(
+                        dashed.ButtonStyle.PRIMARY,
+                        label=option,
+                        custom_id=f"vote:{poll_id}:{option}",
+                        disabled=option == choice,
+                    )
+                    for option in ("yes", "no", "maybe")
+                ]
+            )
+        ],
+    )
+
+
+async def _noop(ctx: dashed.ComponentContext, id: str):
+    return ctx.update()
+
+
+# Enough unrelated patterns that a linear scan over handlers would show up
+for index in range(2000):
+    dashed.component(f"noise{index}:{{id}}")(_noop)
+
+
+_SONGS = [f"song {index}" for index in range(1000)]
+
+
+async def _search_songs(ctx: dashed.InteractionContext, value: str):
+    # Stand in for a slow database query
+    await asyncio.sleep(0.02)
+    return [song for song in _SONGS if song.startswith(value)]
+
+
+@dashed.command(description="Play a song")
+async def play(
+    ctx: dashed.InteractionContext, song: dashed.Autocomplete(str, _search_songs)
+):
+    return ctx.reply(content=f"Playing {song}")
@@ -1,18 +1,49 @@
-from .interaction import InteractionContext, DeferredInteractionContext
-from .discord import Channel, User, Role, Mentionable
-from .loader import command, Group, TypeWithChoices
+from .interaction import (
+    InteractionContext,
+    DeferredInteractionContext,
+    ComponentContext,
+    DeferredComponentContext,
+)
+from .discord import (
+    Channel,
+    User,
+    Member,
+    Role,
+    Mentionable,
+    ActionRow,
+    Button,
+    ButtonStyle,
+    SelectMenu,
+    SelectOption,
+)
+from .loader import command, component, Group, TypeWithChoices, Autocomplete
 from .embeds import Embed, EmbedField
+from .cache import ResponseCache, MemoryBackend
+from .files import File
 
 __all__ = [
     "command",
+    "component",
     "Group",
     "InteractionContext",
     "DeferredInteractionContext",
+    "ComponentContext",
+    "DeferredComponentContext",
     "Channel",
     "User",
+    "Member",
     "Role",
     "Mentionable",
+    "ActionRow",
+    "Button",
+    "ButtonStyle",
+    "SelectMenu",
+    "SelectOption",
     "TypeWithChoices",
+    "Autocomplete",
     "Embed",
     "EmbedField",
+    "ResponseCache",
+    "MemoryBackend",
+    "File",
 ]
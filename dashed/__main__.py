@@ -2,13 +2,27 @@ import argparse
 import asyncio
 import os
 import pathlib
+import signal
 import sys
+import time
+from typing import List, Optional
 
-from nacl.signing import VerifyKey
+from dashed import codec
+from dashed.cache import AsyncTTLCache
+from dashed.discord import DEFAULT_BASE_URL, DiscordAPIClient
+from dashed.executors import HandlerPools
+from dashed.hooks import Hooks
+from dashed.loader import DashedContext, collect_modules, load_modules
+from dashed.manifest import DEFAULT_MANIFEST_PATH, load_manifest, write_manifest
+from dashed.profiler import PROFILER_MODES, SlowRequestProfiler
+from dashed.reload import Reloader
+from dashed.scheduler import Scheduler
+from dashed.supervisor import Supervisor, notify_ready
+from dashed.sync import SchemaCache
+from dashed.verify import SignatureVerifier
 
-from dashed import server
-from dashed.discord import DiscordAPIClient
-from dashed.loader import DashedContext, load_from_file
+# Startup reports count from here, which leaves out importing dashed itself
+_STARTED_AT = time.perf_counter()
 
 ENV_ARGS = {
     "token": "DASHED_DISCORD_TOKEN",
@@ -16,6 +30,34 @@ ENV_ARGS = {
 }
 
 
+def _get_verifier(args) -> Optional[SignatureVerifier]:
+    # Only serve verifies interactions, other subcommands don't need the key
+    if getattr(args, "application_key", None) is None or not hasattr(
+        args, "verify_backend"
+    ):
+        return None
+
+    return SignatureVerifier(
+        bytes.fromhex(args.application_key),
+        backend=args.verify_backend,
+        max_body_size=args.max_body_size,
+        max_timestamp_age=args.max_timestamp_age,
+        thread_threshold=args.verify_thread_threshold,
+    )
+
+
+def _report_startup(modules, lazy: int, elapsed: float):
+    if not modules:
+        return
+
+    slowest = max(modules, key=lambda module: module.initialize_seconds)
+    print(
+        f"Loaded {len(modules)} modules ({lazy} lazily) in {elapsed:.2f}s: "
+        f"imports {sum(module.import_seconds for module in modules):.2f}s, "
+        f"slowest initialize() {slowest.name} {slowest.initialize_seconds:.2f}s"
+    )
+
+
 async def _get_context(args, not_required=None) -> DashedContext:
     for k, v in ENV_ARGS.items():
         if getattr(args, k, None) is None:
@@ -31,35 +73,141 @@ async def _get_context(args, not_required=None) -> DashedContext:
 
             setattr(args, k, value)
 
-    api = DiscordAPIClient(token=args.token)
+    hooks = Hooks()
+    api = DiscordAPIClient(
+        token=args.token,
+        base_url=args.api_base_url,
+        max_connections=args.api_max_connections,
+        max_keepalive_connections=args.api_max_keepalive_connections,
+        keepalive_expiry=args.api_keepalive_expiry,
+        connect_timeout=args.api_connect_timeout,
+        read_timeout=args.api_read_timeout,
+        pool_timeout=args.api_pool_timeout,
+        http2=args.api_http2,
+        hooks=hooks,
+    )
+
+    started = time.perf_counter()
+    paths = [pathlib.Path(file_path) for file_path in args.load_from_file or []]
+    initialize_timeout = args.initialize_timeout
+
+    # Modules that haven't changed since the manifest was written are only
+    # imported once one of their handlers is first used.
+    manifest_path = getattr(args, "manifest", None)
+    lazy = (
+        load_manifest(manifest_path, paths, initialize_timeout)
+        if manifest_path is not None
+        else {}
+    )
+    eager = [path for path in paths if path not in lazy]
+    loaded = dict(zip(eager, await load_modules(eager, initialize_timeout)))
+    modules = [lazy.get(path) or loaded[path] for path in paths]
 
-    modules = []
-    for file_path in args.load_from_file or []:
-        modules.append(await load_from_file(pathlib.Path(file_path)))
+    if manifest_path is not None and eager:
+        write_manifest(manifest_path, modules)
 
-    commands = {}
-    for module in modules:
-        for command in module.commands:
-            commands[command.name] = command
+    _report_startup(modules, len(lazy), time.perf_counter() - started)
 
-    groups = {}
-    for module in modules:
-        for group in module.groups:
-            groups[group.name] = group
+    commands, groups, components = collect_modules(modules)
 
     return DashedContext(
         client=api,
-        application_key=VerifyKey(bytes.fromhex(args.application_key))
-        if hasattr(args, "application_key")
-        else None,
+        # The verifier is built from the serve options, not with the defaults
+        application_key=None,
+        verifier=_get_verifier(args),
         commands=commands,
         groups=groups,
+        components=components,
+        modules=modules,
+        hooks=hooks,
     )
 
 
+def _positive_int(value: str) -> int:
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, got {value}")
+    return number
+
+
+def _get_guild_ids(args) -> List[str]:
+    guild_ids = list(args.guild or [])
+    for path in args.guilds_from_file or []:
+        for line in path.read_text().splitlines():
+            line = line.split("#", 1)[0].strip()
+            if line:
+                guild_ids.append(line)
+    # Keep the order, but sync every guild once
+    return list(dict.fromkeys(guild_ids))
+
+
+async def _register_guild_commands(ctx: DashedContext, args, guild_ids: List[str]):
+    done = 0
+    started = time.perf_counter()
+
+    def report(outcome):
+        nonlocal done
+        done += 1
+        progress = f"[{done}/{len(guild_ids)}] guild {outcome.guild_id}:"
+        if outcome.error is not None:
+            print(f"{progress} failed: {outcome.error!r}")
+        elif outcome.result.cached:
+            print(f"{progress} unchanged since last sync")
+        else:
+            result = outcome.result
+            print(
+                f"{progress} {len(result.created)} created, "
+                f"{len(result.updated)} updated, {len(result.deleted)} deleted, "
+                f"{len(result.unchanged)} unchanged"
+            )
+
+    outcomes = await ctx.sync_guild_commands(
+        args.application_id,
+        guild_ids,
+        strategy=args.strategy,
+        delete_unknown=args.delete_unknown,
+        cache=None if args.no_schema_cache else SchemaCache(args.schema_cache),
+        concurrency=args.guild_concurrency,
+        on_result=report,
+    )
+    failed = [outcome.guild_id for outcome in outcomes if outcome.error is not None]
+    print(
+        f"Synced {len(guild_ids) - len(failed)}/{len(guild_ids)} guilds in "
+        f"{time.perf_counter() - started:.2f}s"
+        + (f", failed: {', '.join(failed)}" if failed else "")
+    )
+    return not failed
+
+
 async def _register_commands(args):
     ctx = await _get_context(args, not_required={"application_key"})
 
+    guild_ids = _get_guild_ids(args)
+    if guild_ids:
+        ok = await _register_guild_commands(ctx, args, guild_ids)
+        await ctx.client.close()
+        if not ok:
+            sys.exit(1)
+        return
+
+    if args.sync:
+        result = await ctx.sync_commands(
+            args.application_id,
+            strategy=args.strategy,
+            delete_unknown=args.delete_unknown,
+            cache=None if args.no_schema_cache else SchemaCache(args.schema_cache),
+        )
+        if result.cached:
+            print("Command schema unchanged since last sync, nothing to do")
+        else:
+            print(
+                f"Synced commands: {len(result.created)} created, "
+                f"{len(result.updated)} updated, {len(result.deleted)} deleted, "
+                f"{len(result.unchanged)} unchanged"
+            )
+        await ctx.client.close()
+        return
+
     if args.delete_unknown:
         existing_commands = await ctx.client.get_global_application_commands(
             args.application_id
@@ -74,10 +222,135 @@ async def _register_commands(args):
     await ctx.client.close()
 
 
-async def _serve(args):
+async def _fake_discord(args):
+    from dashed import fake_discord
+
+    await fake_discord.run(
+        args.host,
+        args.port,
+        fake_discord.FakeDiscordConfig(
+            latency=args.latency,
+            jitter=args.jitter,
+            global_limit=args.global_limit,
+            command_limit=args.command_limit,
+            command_window=args.command_window,
+            webhook_limit=args.webhook_limit,
+            webhook_window=args.webhook_window,
+        ),
+    )
+
+
+async def _serve(args, worker: int = 0):
+    from dashed import server
+
+    codec.use(args.json_backend)
     ctx = await _get_context(args)
-    await server.run(args.host, args.port, ctx)
-    await ctx.client.close()
+    ctx.scheduler = Scheduler(
+        concurrency=args.max_concurrency,
+        max_queue=args.max_queue,
+        default_timeout=args.task_timeout,
+    )
+    ctx.response_deadline = args.response_deadline or None
+    ctx.pools = HandlerPools(args.thread_pool_size, args.process_pool_size)
+    if args.dedup_size > 0 and args.dedup_ttl > 0:
+        ctx.recent_interactions = AsyncTTLCache(
+            "interactions", max_size=args.dedup_size, ttl=args.dedup_ttl
+        )
+
+    # Fork the process pool now, before the server has started any threads
+    handlers = [compiled.command for compiled in ctx.dispatch.values()]
+    handlers.extend(ctx.components.values())
+    if any(handler.executor == "process" for handler in handlers):
+        await ctx.pools.process.start()
+
+    if args.profile_slow_requests is not None:
+        SlowRequestProfiler(
+            args.profile_slow_requests,
+            threshold=args.profile_threshold,
+            mode=args.profile_mode,
+        ).install(ctx.hooks)
+
+    # Every worker reloads its own modules, but only the first one syncs
+    reloader = Reloader(
+        ctx,
+        ctx.modules,
+        application_id=args.application_id,
+        sync=args.reload_sync and worker == 0,
+    )
+    # SIGUSR1 reloads every module, --reload also polls files for changes
+    loop = asyncio.get_event_loop()
+    loop.add_signal_handler(signal.SIGUSR1, lambda: loop.create_task(reloader.reload()))
+    watcher = (
+        loop.create_task(reloader.watch(args.reload_interval)) if args.reload else None
+    )
+    try:
+        await server.run(
+            args.host,
+            args.port,
+            ctx,
+            drain_timeout=args.drain_timeout,
+            shutdown_timeout=args.shutdown_timeout,
+            reuse_port=args.workers > 1,
+            metrics=args.metrics,
+            warm_up_connections=args.warm_up_connections,
+            warm_up_timeout=args.warm_up_timeout,
+            started_at=_STARTED_AT,
+            on_ready=notify_ready,
+        )
+    finally:
+        if watcher is not None:
+            watcher.cancel()
+        ctx.pools.shutdown(wait=False)
+        await ctx.client.close()
+
+
+def _add_api_arguments(parser):
+    parser.add_argument(
+        "--api-base-url",
+        default=DEFAULT_BASE_URL,
+        help="The Discord API base URL (e.g. a local fake-discord server)",
+    )
+    parser.add_argument(
+        "--api-max-connections",
+        default=100,
+        type=int,
+        help="The maximum number of open connections to the Discord API",
+    )
+    parser.add_argument(
+        "--api-max-keepalive-connections",
+        default=20,
+        type=int,
+        help="The maximum number of idle connections kept open",
+    )
+    parser.add_argument(
+        "--api-keepalive-expiry",
+        default=30.0,
+        type=float,
+        help="How long (in seconds) idle connections are kept open",
+    )
+    parser.add_argument(
+        "--api-connect-timeout",
+        default=5.0,
+        type=float,
+        help="Timeout (in seconds) for opening a connection to the Discord API",
+    )
+    parser.add_argument(
+        "--api-read-timeout",
+        default=10.0,
+        type=float,
+        help="Timeout (in seconds) for reading a Discord API response",
+    )
+    parser.add_argument(
+        "--api-pool-timeout",
+        default=5.0,
+        type=float,
+        help="Timeout (in seconds) for waiting on a free connection from the pool",
+    )
+    parser.add_argument(
+        "--api-http2",
+        help="Use HTTP/2 for the Discord API (requires dashed[http2])",
+        action="store_true",
+    )
 
 
 parser = argparse.ArgumentParser("dashed")
@@ -99,6 +372,53 @@ register_commands_parser.add_argument(
     action="append",
     help="Load interactions and slash commands from a Python file",
 )
+_add_api_arguments(register_commands_parser)
+register_commands_parser.add_argument(
+    "--initialize-timeout",
+    default=None,
+    type=float,
+    help="Fail startup when a module's initialize() takes longer than this",
+)
+register_commands_parser.add_argument(
+    "--sync",
+    help="Only send the changes between the local and registered commands",
+    action="store_true",
+)
+register_commands_parser.add_argument(
+    "--guild",
+    action="append",
+    help="Sync the commands as guild commands of this guild (repeatable), "
+    "guild commands are always synced as with --sync",
+)
+register_commands_parser.add_argument(
+    "--guilds-from-file",
+    action="append",
+    type=pathlib.Path,
+    help="Sync guild commands for every guild id in this file (one per line)",
+)
+register_commands_parser.add_argument(
+    "--guild-concurrency",
+    default=8,
+    type=_positive_int,
+    help="The maximum number of guilds synced at once",
+)
+register_commands_parser.add_argument(
+    "--strategy",
+    default="bulk",
+    choices=("bulk", "minimal"),
+    help="Sync with a single bulk overwrite or individual create/edit/delete calls",
+)
+register_commands_parser.add_argument(
+    "--schema-cache",
+    default=".dashed-schema-cache.json",
+    type=pathlib.Path,
+    help="Where to store the hash of the last synced command schema",
+)
+register_commands_parser.add_argument(
+    "--no-schema-cache",
+    help="Always compare against the registered commands",
+    action="store_true",
+)
 
 serve_parser = subparsers.add_parser("serve")
 serve_parser.set_defaults(fn=_serve)
@@ -115,23 +435,248 @@ serve_parser.add_argument(
 serve_parser.add_argument("--port", default=8689, type=int, help="The port to bind on")
 serve_parser.add_argument("--token", help="Discord Bot Token")
 serve_parser.add_argument("--application-key", help="Discord Application Key")
+_add_api_arguments(serve_parser)
+serve_parser.add_argument(
+    "--initialize-timeout",
+    default=None,
+    type=float,
+    help="Fail startup when a module's initialize() takes longer than this",
+)
+serve_parser.add_argument(
+    "--verify-backend",
+    default="auto",
+    choices=("auto", "pynacl", "cryptography"),
+    help="The library used to verify request signatures (auto picks the fastest)",
+)
+serve_parser.add_argument(
+    "--max-body-size",
+    default=1024 * 1024,
+    type=int,
+    help="Reject interaction requests with bodies larger than this many bytes",
+)
+serve_parser.add_argument(
+    "--max-timestamp-age",
+    default=300.0,
+    type=float,
+    help="Reject interaction requests signed more than this many seconds ago",
+)
+serve_parser.add_argument(
+    "--verify-thread-threshold",
+    default=None,
+    type=int,
+    help="Verify bodies of at least this many bytes in a thread pool",
+)
+serve_parser.add_argument(
+    "--max-concurrency",
+    default=64,
+    type=int,
+    help="The maximum number of deferred handlers running at once",
+)
+serve_parser.add_argument(
+    "--max-queue",
+    default=1024,
+    type=int,
+    help="The maximum number of deferred handlers waiting to run",
+)
+serve_parser.add_argument(
+    "--task-timeout",
+    default=None,
+    type=float,
+    help="The default timeout (in seconds) for deferred handlers",
+)
+serve_parser.add_argument(
+    "--thread-pool-size",
+    default=None,
+    type=int,
+    help="Threads running synchronous handlers (default: CPUs + 4, at most 32)",
+)
+serve_parser.add_argument(
+    "--process-pool-size",
+    default=None,
+    type=int,
+    help='Processes running executor="process" handlers (default: CPUs)',
+)
+serve_parser.add_argument(
+    "--response-deadline",
+    default=2.5,
+    type=float,
+    help="Defer commands that have not replied after this many seconds (0 disables)",
+)
+serve_parser.add_argument(
+    "--dedup-size",
+    default=10000,
+    type=int,
+    help="Responses to remember for answering repeated deliveries (0 disables)",
+)
+serve_parser.add_argument(
+    "--dedup-ttl",
+    default=60.0,
+    type=float,
+    help="How long (in seconds) repeated deliveries get the remembered response",
+)
+serve_parser.add_argument(
+    "--warm-up-connections",
+    default=2,
+    type=int,
+    help="Connections to open to the Discord API before accepting interactions",
+)
+serve_parser.add_argument(
+    "--warm-up-timeout",
+    default=10.0,
+    type=float,
+    help="How long (in seconds) to wait for the warm-up before starting anyway",
+)
+serve_parser.add_argument(
+    "--manifest",
+    nargs="?",
+    const=DEFAULT_MANIFEST_PATH,
+    type=pathlib.Path,
+    help="Cache a command manifest (in .dashed-manifest.json by default) and "
+    "import unchanged modules on first use",
+)
+serve_parser.add_argument(
+    "--reload",
+    help="Reload command modules when their files change",
+    action="store_true",
+)
+serve_parser.add_argument(
+    "--reload-interval",
+    default=1.0,
+    type=float,
+    help="How often (in seconds) --reload checks files for changes",
+)
+serve_parser.add_argument(
+    "--reload-sync",
+    help="Sync command schemas that changed on reload (needs --application-id)",
+    action="store_true",
+)
+serve_parser.add_argument(
+    "--application-id", help="Discord Application ID, used by --reload-sync"
+)
+serve_parser.add_argument(
+    "--drain-timeout",
+    default=30.0,
+    type=float,
+    help="How long (in seconds) to wait for deferred handlers on shutdown",
+)
+serve_parser.add_argument(
+    "--shutdown-timeout",
+    default=60.0,
+    type=float,
+    help="How long (in seconds) to wait for in-flight requests on shutdown",
+)
+serve_parser.add_argument(
+    "--workers",
+    default=1,
+    type=int,
+    help="The number of worker processes sharing the port (with SO_REUSEPORT)",
+)
+serve_parser.add_argument(
+    "--metrics",
+    help="Serve Prometheus metrics on /metrics",
+    action="store_true",
+)
+serve_parser.add_argument(
+    "--profile-slow-requests",
+    type=pathlib.Path,
+    metavar="DIRECTORY",
+    help="Write a report for interactions slower than --profile-threshold here",
+)
+serve_parser.add_argument(
+    "--profile-threshold",
+    default=1.0,
+    type=float,
+    help="Interactions taking longer than this (in seconds) are reported",
+)
+serve_parser.add_argument(
+    "--profile-mode",
+    default="stack",
+    choices=PROFILER_MODES,
+    help="Sample the event loop's stack while a request is slow, or cProfile "
+    "requests (one at a time)",
+)
+serve_parser.add_argument(
+    "--json-backend",
+    default="auto",
+    choices=("auto", "orjson", "ujson", "json"),
+    help="The JSON library used to encode and decode payloads",
+)
+
+fake_discord_parser = subparsers.add_parser("fake-discord")
+fake_discord_parser.set_defaults(fn=_fake_discord)
+fake_discord_parser.add_argument(
+    "--host",
+    default="localhost",
+    help="The host string to bind on",
+)
+fake_discord_parser.add_argument(
+    "--port", default=8690, type=int, help="The port to bind on"
+)
+fake_discord_parser.add_argument(
+    "--latency", default=0.05, type=float, help="Mean response latency in seconds"
+)
+fake_discord_parser.add_argument(
+    "--jitter", default=0.02, type=float, help="Random latency jitter in seconds"
+)
+fake_discord_parser.add_argument(
+    "--global-limit", default=50, type=int, help="Global requests per second"
+)
+fake_discord_parser.add_argument(
+    "--command-limit", default=5, type=int, help="Requests per command bucket window"
+)
+fake_discord_parser.add_argument(
+    "--command-window",
+    default=20.0,
+    type=float,
+    help="Command bucket window in seconds",
+)
+fake_discord_parser.add_argument(
+    "--webhook-limit", default=5, type=int, help="Requests per webhook bucket window"
+)
+fake_discord_parser.add_argument(
+    "--webhook-window",
+    default=2.0,
+    type=float,
+    help="Webhook bucket window in seconds",
+)
 
 
 def _run_in_loop(fn):
     event_loop = asyncio.get_event_loop()
+    task = event_loop.create_task(fn)
+
+    # Cancel the main task on shutdown signals so cleanup (like draining
+    # deferred handlers) gets a chance to run.
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        if signal.getsignal(sig) is not signal.SIG_IGN:
+            event_loop.add_signal_handler(sig, task.cancel)
+
     try:
-        event_loop.run_until_complete(fn)
+        event_loop.run_until_complete(task)
+    except asyncio.CancelledError:
+        pass
     finally:
         event_loop.close()
 
 
-async def main():
+def main():
     args = parser.parse_args()
     if not hasattr(args, "fn"):
         parser.print_help()
         return
 
-    await args.fn(args)
+    if getattr(args, "reload_sync", False) and not args.application_id:
+        parser.error("--reload-sync requires --application-id")
+
+    if getattr(args, "workers", 1) > 1:
+        Supervisor(
+            lambda worker: _run_in_loop(args.fn(args, worker)),
+            workers=args.workers,
+            shutdown_timeout=args.drain_timeout + args.shutdown_timeout,
+        ).run()
+        return
+
+    _run_in_loop(args.fn(args))
 
 
-_run_in_loop(main())
+main()
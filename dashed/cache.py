@@ -0,0 +1,171 @@
+import asyncio
+import collections
+import dataclasses
+import time
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+from dashed.metrics import CACHE_REQUESTS
+
+_MISSING = object()
+
+
+@dataclasses.dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    coalesced: int = 0
+    evictions: int = 0
+
+
+class AsyncTTLCache:
+    def __init__(self, name: str, max_size: int = 1024, ttl: Optional[float] = 60.0):
+        self.name = name
+        self.max_size = max_size
+        self.ttl = ttl
+        self.stats = CacheStats()
+
+        self._entries: "collections.OrderedDict[Hashable, Tuple[float, Any]]" = (
+            collections.OrderedDict()
+        )
+        self._pending: Dict[Hashable, asyncio.Future] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        entry = self._entries.get(key)
+        if entry is None:
+            return default
+
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            return default
+
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key: Hashable, value: Any):
+        expires_at = float("inf") if self.ttl is None else time.monotonic() + self.ttl
+        self._entries[key] = (expires_at, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.stats.evictions += 1
+
+    def invalidate(self, key: Hashable):
+        self._entries.pop(key, None)
+
+    def clear(self):
+        self._entries.clear()
+
+    def clear_prefix(self, prefix: str):
+        for key in [key for key in self._entries if key.startswith(prefix)]:
+            del self._entries[key]
+
+    async def get_or_compute(
+        self, key: Hashable, factory: Callable[[], Awaitable[Any]]
+    ) -> Any:
+        value = self.get(key, _MISSING)
+        if value is not _MISSING:
+            self.stats.hits += 1
+            CACHE_REQUESTS.inc(cache=self.name, result="hit")
+            return value
+
+        # Callers asking for a key that is already being computed wait on the
+        # same task instead of starting another lookup. The task belongs to no
+        # caller, so one of them being cancelled doesn't fail the others.
+        pending = self._pending.get(key)
+        if pending is not None:
+            self.stats.coalesced += 1
+            CACHE_REQUESTS.inc(cache=self.name, result="coalesced")
+        else:
+            self.stats.misses += 1
+            CACHE_REQUESTS.inc(cache=self.name, result="miss")
+            pending = asyncio.ensure_future(self._compute(key, factory))
+            self._pending[key] = pending
+        return await asyncio.shield(pending)
+
+    async def _compute(self, key: Hashable, factory: Callable[[], Awaitable[Any]]):
+        try:
+            value = await factory()
+            self.set(key, value)
+            return value
+        finally:
+            del self._pending[key]
+
+
+class MemoryBackend:
+    # Response cache storage in this process, so every --workers process has
+    # its own. A shared store (used by every worker) implements the same four
+    # coroutines.
+    def __init__(self, max_size: int = 1024, ttl: Optional[float] = 60.0):
+        self._cache = AsyncTTLCache("responses", max_size=max_size, ttl=ttl)
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return self._cache.get(key)
+
+    async def set(self, key: str, value: bytes):
+        self._cache.set(key, value)
+
+    async def delete(self, key: str):
+        self._cache.invalidate(key)
+
+    async def clear(self, prefix: str):
+        self._cache.clear_prefix(prefix)
+
+
+RESPONSE_CACHE_SCOPES = ("user", "guild")
+
+
+def _key_value(value: Any) -> Any:
+    # Resolved users, roles and channels are keyed by their id
+    return getattr(value, "id", value)
+
+
+class ResponseCache:
+    def __init__(
+        self,
+        ttl: Optional[float] = 60.0,
+        max_size: int = 1024,
+        scope: Optional[str] = None,
+        backend: Optional[Any] = None,
+        name: Optional[str] = None,
+    ):
+        assert scope is None or scope in RESPONSE_CACHE_SCOPES, f"unknown scope {scope}"
+        self.scope = scope
+        self.name = name
+        self.backend = backend or MemoryBackend(max_size=max_size, ttl=ttl)
+
+    def _scope_id(self, data: Dict[str, Any]) -> str:
+        if self.scope == "user":
+            user = data.get("member", {}).get("user") or data.get("user", {})
+            return user.get("id", "")
+        elif self.scope == "guild":
+            return data.get("guild_id", "")
+        return ""
+
+    def _key(self, scope_id: str, args: Dict[str, Any]) -> str:
+        args = sorted((name, _key_value(value)) for name, value in args.items())
+        return f"{self.name}\x1f{scope_id}\x1f{args!r}"
+
+    def key(self, data: Dict[str, Any], args: Dict[str, Any]) -> str:
+        return self._key(self._scope_id(data), args)
+
+    async def get(self, key: str) -> Optional[bytes]:
+        value = await self.backend.get(key)
+        CACHE_REQUESTS.inc(cache=self.name, result="miss" if value is None else "hit")
+        return value
+
+    async def set(self, key: str, value: bytes):
+        await self.backend.set(key, value)
+
+    async def invalidate(
+        self, *, user_id: Optional[str] = None, guild_id: Optional[str] = None, **args
+    ):
+        # Drops the response for one set of arguments, in the scope of the
+        # given user or guild when the cache is scoped.
+        await self.backend.delete(self._key(user_id or guild_id or "", args))
+
+    async def clear(self):
+        await self.backend.clear(f"{self.name}\x1f")
@@ -0,0 +1,69 @@
+import json
+from typing import Any, Callable, Union
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+
+def _stdlib_dumps(value: Any) -> bytes:
+    return json.dumps(value, separators=(",", ":")).encode("utf-8")
+
+
+def _stdlib_loads(value: Union[bytes, bytearray, memoryview, str]) -> Any:
+    if isinstance(value, memoryview):
+        value = value.tobytes()
+    return json.loads(value)
+
+
+def _ujson_dumps(value: Any) -> bytes:
+    return ujson.dumps(value, ensure_ascii=False).encode("utf-8")
+
+
+def _ujson_loads(value: Union[bytes, bytearray, memoryview, str]) -> Any:
+    if isinstance(value, (bytearray, memoryview)):
+        value = bytes(value)
+    return ujson.loads(value)
+
+
+def _select_backend(name: str):
+    if name == "orjson":
+        if orjson is None:
+            raise ImportError("the orjson JSON backend requires the orjson package")
+        return orjson.dumps, orjson.loads
+    elif name == "ujson":
+        if ujson is None:
+            raise ImportError("the ujson JSON backend requires the ujson package")
+        return _ujson_dumps, _ujson_loads
+    elif name == "json":
+        return _stdlib_dumps, _stdlib_loads
+    elif name == "auto":
+        if orjson is not None:
+            return _select_backend("orjson")
+        elif ujson is not None:
+            return _select_backend("ujson")
+        return _select_backend("json")
+    raise ValueError(f"unknown JSON backend {name!r}")
+
+
+backend: str = "auto"
+dumps: Callable[[Any], bytes]
+loads: Callable[[Union[bytes, bytearray, memoryview, str]], Any]
+
+
+def use(name: str):
+    global backend, dumps, loads
+
+    dumps, loads = _select_backend(name)
+    if name == "auto":
+        name = "orjson" if orjson else "ujson" if ujson else "json"
+    backend = name
+
+
+use("auto")
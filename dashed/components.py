@@ -0,0 +1,152 @@
+import dataclasses
+import re
+import types
+import typing
+from typing import Any, Callable, Dict, Iterable, List, Mapping, Optional, Tuple
+
+SEPARATOR = ":"
+
+_PARAMETER = re.compile(r"^\{([A-Za-z_][A-Za-z0-9_]*)\}$")
+
+_CONVERTERS = {str: None, int: int, float: float}
+
+
+@dataclasses.dataclass(frozen=True)
+class CompiledComponent:
+    pattern: str
+    component: Any
+    parameters: Tuple[str, ...]
+    converters: Tuple[Optional[Callable[[str], Any]], ...]
+
+    def decode(self, values: List[str]) -> Dict[str, Any]:
+        args = {}
+        for name, converter, value in zip(self.parameters, self.converters, values):
+            args[name] = value if converter is None else converter(value)
+        return args
+
+
+class _Node:
+    __slots__ = ("literals", "parameter", "target")
+
+    def __init__(self):
+        self.literals: Dict[str, "_Node"] = {}
+        self.parameter: Optional["_Node"] = None
+        self.target: Optional[CompiledComponent] = None
+
+
+def _parse_pattern(pattern: str) -> List[Tuple[bool, str]]:
+    segments = []
+    for segment in pattern.split(SEPARATOR):
+        match = _PARAMETER.match(segment)
+        if match is not None:
+            segments.append((True, match.group(1)))
+        elif "{" in segment or "}" in segment:
+            raise ValueError(
+                f"invalid component pattern {pattern!r}, parameters must fill a "
+                f"whole {SEPARATOR!r} separated segment"
+            )
+        else:
+            segments.append((False, segment))
+    return segments
+
+
+def compile_component(component) -> CompiledComponent:
+    segments = _parse_pattern(component.pattern)
+    parameters = tuple(name for is_parameter, name in segments if is_parameter)
+    if len(set(parameters)) != len(parameters):
+        raise ValueError(f"duplicate parameter in component {component.pattern!r}")
+
+    hints = typing.get_type_hints(component.fn)
+    args = [k for k in list(hints.keys())[1:] if k != "return"]
+    if sorted(args) != sorted(parameters):
+        raise ValueError(
+            f"component handler {component.fn.__name__} takes {args} but "
+            f"pattern {component.pattern!r} provides {list(parameters)}"
+        )
+
+    converters = []
+    for name in parameters:
+        if hints[name] not in _CONVERTERS:
+            raise ValueError(f"unsupported type for component parameter {name!r}")
+        converters.append(_CONVERTERS[hints[name]])
+
+    return CompiledComponent(
+        pattern=component.pattern,
+        component=component,
+        parameters=parameters,
+        converters=tuple(converters),
+    )
+
+
+class ComponentRouter:
+    # custom_ids are matched against a trie of their separated segments, so
+    # lookups cost the same no matter how many patterns are registered.
+    def __init__(self, components: Iterable[Any] = ()):
+        self._root = _Node()
+        self._exact: Dict[str, CompiledComponent] = {}
+        self.patterns: Mapping[str, CompiledComponent] = types.MappingProxyType({})
+
+        patterns = {}
+        for component in components:
+            compiled = self._add(component)
+            patterns[compiled.pattern] = compiled
+        self.patterns = types.MappingProxyType(patterns)
+
+    def _add(self, component) -> CompiledComponent:
+        compiled = compile_component(component)
+
+        node = self._root
+        for is_parameter, segment in _parse_pattern(compiled.pattern):
+            if is_parameter:
+                if node.parameter is None:
+                    node.parameter = _Node()
+                node = node.parameter
+            else:
+                node = node.literals.setdefault(segment, _Node())
+
+        if node.target is not None:
+            raise ValueError(
+                f"component pattern {compiled.pattern!r} conflicts with "
+                f"{node.target.pattern!r}"
+            )
+        node.target = compiled
+
+        if not compiled.parameters:
+            self._exact[compiled.pattern] = compiled
+        return compiled
+
+    def _match(
+        self, node: _Node, segments: List[str], index: int, values: List[str]
+    ) -> Optional[CompiledComponent]:
+        if index == len(segments):
+            return node.target
+
+        # Literal segments win over parameters, and we only fall back to the
+        # parameter branch when the literal branch does not lead to a match.
+        child = node.literals.get(segments[index])
+        if child is not None:
+            target = self._match(child, segments, index + 1, values)
+            if target is not None:
+                return target
+
+        if node.parameter is not None:
+            values.append(segments[index])
+            target = self._match(node.parameter, segments, index + 1, values)
+            if target is not None:
+                return target
+            values.pop()
+
+        return None
+
+    def match(
+        self, custom_id: str
+    ) -> Optional[Tuple[CompiledComponent, Dict[str, Any]]]:
+        compiled = self._exact.get(custom_id)
+        if compiled is not None:
+            return compiled, {}
+
+        values: List[str] = []
+        compiled = self._match(self._root, custom_id.split(SEPARATOR), 0, values)
+        if compiled is None:
+            return None
+        return compiled, compiled.decode(values)
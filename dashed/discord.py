@@ -1,11 +1,19 @@
 import asyncio
 import dataclasses
 from enum import IntEnum
-from typing import List, Literal, Optional, Union
-
-import httpx
+from typing import Any, Dict, List, Literal, Optional, Union
 
+from dashed import codec
 from dashed.embeds import Embed
+from dashed.files import MultipartBody
+from dashed.hooks import Hooks
+from dashed.metrics import (
+    API_ERRORS,
+    API_LATENCY,
+    API_RATE_LIMIT_SLEEP,
+    API_RATE_LIMITED,
+)
+from dashed.ratelimit import RateLimiter, Route
 
 
 class ChannelType(IntEnum):
@@ -22,41 +30,140 @@ class ChannelType(IntEnum):
     GUILD_STAGE_VOICE = 13
 
 
-@dataclasses.dataclass
-class Channel:
-    id: str
-    name: str
-    permissions: str
-    type: ChannelType
+def _field(name: str, default: Any = None) -> property:
+    return property(lambda self: self._data.get(name, default))
 
 
-@dataclasses.dataclass
-class User:
-    id: str
-    username: str
-    discriminator: str
-    public_flags: int
-    avatar: str
-    bot: bool = False
+class _ResolvedView:
+    # Resolved objects are thin views over the interaction payload, fields
+    # are only read when accessed and unknown keys are simply ignored.
+    __slots__ = ("_data",)
+
+    def __init__(self, data: Dict[str, Any]):
+        self._data = data
+
+    id = _field("id")
+
+    @property
+    def raw(self) -> Dict[str, Any]:
+        return self._data
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return self._data.get(key, default)
+
+    def __eq__(self, other):
+        return type(self) is type(other) and self.id == other.id
+
+    def __hash__(self):
+        return hash((type(self), self.id))
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self._data!r})"
+
+
+class Channel(_ResolvedView):
+    __slots__ = ()
+
+    name = _field("name")
+    permissions = _field("permissions")
+    parent_id = _field("parent_id")
+    thread_metadata = _field("thread_metadata")
+
+    @property
+    def type(self) -> Union[ChannelType, int]:
+        value = self._data.get("type")
+        try:
+            return ChannelType(value)
+        except ValueError:
+            return value
+
+    def mention(self):
+        return f"<#{self.id}>"
+
+
+class Mentionable(_ResolvedView):
+    # Mentionable options resolve to a User or a Role
+    __slots__ = ()
+
+
+class User(Mentionable):
+    __slots__ = ("_member",)
+
+    def __init__(self, data: Dict[str, Any], member: Optional[Dict[str, Any]] = None):
+        self._data = data
+        self._member = member
+
+    username = _field("username")
+    discriminator = _field("discriminator")
+    public_flags = _field("public_flags", 0)
+    avatar = _field("avatar")
+    bot = _field("bot", False)
+
+    @property
+    def member(self) -> Optional["Member"]:
+        if self._member is None:
+            return None
+        return Member(self._member, self._data)
 
     def mention(self):
         return f"<@{self.id}>"
 
 
-@dataclasses.dataclass
-class Role:
-    pass
+class Member(_ResolvedView):
+    # Resolved member data has no user object, the user lives next to it
+    __slots__ = ("_user",)
 
+    def __init__(self, data: Dict[str, Any], user: Dict[str, Any]):
+        self._data = data
+        self._user = user
 
-@dataclasses.dataclass
-class Mentionable:
-    pass
+    nick = _field("nick")
+    roles = _field("roles", ())
+    joined_at = _field("joined_at")
+    premium_since = _field("premium_since")
+    permissions = _field("permissions")
+    pending = _field("pending", False)
+
+    @property
+    def id(self):
+        return self._user["id"]
+
+    @property
+    def user(self) -> User:
+        return User(self._user, self._data)
+
+    @property
+    def display_name(self) -> str:
+        return self._data.get("nick") or self._user.get("username")
+
+    def mention(self):
+        return f"<@{self.id}>"
+
+
+class Role(Mentionable):
+    __slots__ = ()
+
+    name = _field("name")
+    color = _field("color", 0)
+    hoist = _field("hoist", False)
+    position = _field("position", 0)
+    permissions = _field("permissions")
+    managed = _field("managed", False)
+    mentionable = _field("mentionable", False)
+
+    def mention(self):
+        return f"<@&{self.id}>"
 
 
 class InteractionRequestType(IntEnum):
     PING = 1
     APPLICATION_COMMAND = 2
     MESSAGE_COMPONENT = 3
+    APPLICATION_COMMAND_AUTOCOMPLETE = 4
+
+
+class MessageFlags(IntEnum):
+    EPHEMERAL = 1 << 6
 
 
 class InteractionResponseType(IntEnum):
@@ -65,6 +172,7 @@ class InteractionResponseType(IntEnum):
     DEFERRED_CHANNEL_MESSAGE_WITH_SOURCE = 5
     DEFERRED_UPDATE_MESSAGE = 6
     UPDATE_MESSAGE = 7
+    APPLICATION_COMMAND_AUTOCOMPLETE_RESULT = 8
 
 
 class ApplicationCommandOptionType(IntEnum):
@@ -79,6 +187,20 @@ class ApplicationCommandOptionType(IntEnum):
     MENTIONABLE = 9
 
 
+class ComponentType(IntEnum):
+    ACTION_ROW = 1
+    BUTTON = 2
+    SELECT_MENU = 3
+
+
+class ButtonStyle(IntEnum):
+    PRIMARY = 1
+    SECONDARY = 2
+    SUCCESS = 3
+    DANGER = 4
+    LINK = 5
+
+
 @dataclasses.dataclass
 class AllowedMentions:
     parse: List[Literal["roles", "users", "everyone"]]
@@ -87,6 +209,52 @@ class AllowedMentions:
     replied_user: bool = False
 
 
+@dataclasses.dataclass
+class Button:
+    style: ButtonStyle
+    label: Optional[str] = None
+    custom_id: Optional[str] = None
+    url: Optional[str] = None
+    emoji: Optional[Dict[str, Any]] = None
+    disabled: bool = False
+    type: ComponentType = dataclasses.field(init=False)
+
+    def __post_init__(self):
+        self.type = ComponentType.BUTTON
+
+
+@dataclasses.dataclass
+class SelectOption:
+    label: str
+    value: str
+    description: Optional[str] = None
+    emoji: Optional[Dict[str, Any]] = None
+    default: bool = False
+
+
+@dataclasses.dataclass
+class SelectMenu:
+    custom_id: str
+    options: List[SelectOption]
+    placeholder: Optional[str] = None
+    min_values: Optional[int] = None
+    max_values: Optional[int] = None
+    disabled: bool = False
+    type: ComponentType = dataclasses.field(init=False)
+
+    def __post_init__(self):
+        self.type = ComponentType.SELECT_MENU
+
+
+@dataclasses.dataclass
+class ActionRow:
+    components: List[Union[Button, SelectMenu]]
+    type: ComponentType = dataclasses.field(init=False)
+
+    def __post_init__(self):
+        self.type = ComponentType.ACTION_ROW
+
+
 @dataclasses.dataclass
 class ApplicationCommandCallbackData:
     tts: Optional[bool] = None
@@ -94,7 +262,7 @@ class ApplicationCommandCallbackData:
     embeds: Optional[List[Embed]] = None
     allowed_mentions: Optional[AllowedMentions] = None
     flags: Optional[int] = None
-    components: Optional[List] = None
+    components: Optional[List[ActionRow]] = None
 
 
 @dataclasses.dataclass
@@ -113,6 +281,7 @@ class ApplicationCommandOption:
         default_factory=list
     )
     options: List["ApplicationCommandOption"] = dataclasses.field(default_factory=list)
+    autocomplete: bool = False
 
 
 @dataclasses.dataclass
@@ -128,66 +297,299 @@ class WebhookEditBody:
     content: Optional[str] = None
     allowed_mentions: Optional[AllowedMentions] = None
     embeds: Optional[List[Embed]] = None
+    components: Optional[List[ActionRow]] = None
+
+
+DEFAULT_BASE_URL = "https://discord.com/api/v8"
+
+
+def _error_body(response) -> Dict[str, Any]:
+    # Proxies in front of Discord can answer errors with HTML or plain text
+    try:
+        body = codec.loads(response.content)
+    except ValueError:
+        return {}
+    return body if isinstance(body, dict) else {}
 
 
 class DiscordAPIClient:
-    def __init__(self, token):
+    def __init__(
+        self,
+        token,
+        ratelimiter: Optional[RateLimiter] = None,
+        retries=3,
+        base_url: str = DEFAULT_BASE_URL,
+        max_connections: Optional[int] = 100,
+        max_keepalive_connections: Optional[int] = 20,
+        keepalive_expiry: Optional[float] = 30.0,
+        connect_timeout: Optional[float] = 5.0,
+        read_timeout: Optional[float] = 10.0,
+        pool_timeout: Optional[float] = 5.0,
+        http2: bool = False,
+        hooks: Optional[Hooks] = None,
+    ):
+        # httpx is only imported once a client is needed, which keeps it off
+        # the startup path of commands (and modules) that never make requests.
+        import httpx
+
         self._http = httpx.AsyncClient(
             headers={
                 "Authorization": f"Bot {token}",
                 "User-Agent": "DiscordBot (https://github.com/b1naryth1ef/dashed dev)",
-            }
+            },
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_keepalive_connections,
+                keepalive_expiry=keepalive_expiry,
+            ),
+            timeout=httpx.Timeout(
+                connect=connect_timeout,
+                read=read_timeout,
+                write=read_timeout,
+                pool=pool_timeout,
+            ),
+            http2=http2,
         )
+        self.ratelimiter = ratelimiter or RateLimiter()
+        self.retries = retries
+        self.base_url = base_url.rstrip("/")
+        self.hooks = hooks or Hooks()
 
     async def close(self):
         await self._http.aclose()
 
+    async def warm_up(self, connections: int = 1):
+        # Open (and TLS handshake) connections ahead of the first real
+        # request. The endpoint needs no auth, so the token isn't sent, and
+        # the response is ignored. With HTTP/2 the requests share a single
+        # connection.
+        route = Route("GET", "/gateway")
+
+        async def ping():
+            request = self._http.build_request("GET", self._url(route.path))
+            del request.headers["Authorization"]
+            try:
+                async with self.ratelimiter.acquire(route) as ticket:
+                    r = await self._http.send(request)
+                    ticket.update(r.headers)
+            except Exception as e:
+                print(f"Warm-up request failed: {e!r}")
+
+        # Requests on a bucket the limiter doesn't know yet go one at a time,
+        # learn it first so the others open their connections concurrently.
+        await ping()
+        await asyncio.gather(*(ping() for _ in range(connections)))
+
     def _url(self, path):
-        return f"https://discord.com/api/v8{path}"
+        return f"{self.base_url}{path}"
 
-    async def _check(self, response):
-        if "X-RateLimit-Reset-After" in response.headers:
-            if int(response.headers["X-RateLimit-Remaining"]) == 0:
-                await asyncio.sleep(float(response.headers["X-RateLimit-Reset-After"]))
+    def _check(self, response):
+        import httpx
 
         try:
             response.raise_for_status()
-        except Exception:
-            print("Response: ", response.json())
-            raise
+        except httpx.HTTPStatusError as e:
+            # Discord explains what was wrong in the body, keep it with the
+            # error instead of printing it for every failed request.
+            raise httpx.HTTPStatusError(
+                f"{e}\nResponse: {response.text[:1000]}",
+                request=e.request,
+                response=response,
+            ) from None
+
+    async def _request(self, route: Route, json=None, files=None):
+        with self.hooks.stage("api", route.key):
+            kwargs = {}
+            multipart = None
+            if files:
+                multipart = MultipartBody(json, files)
+                kwargs["headers"] = multipart.headers
+            elif json is not None:
+                kwargs["content"] = codec.dumps(json)
+                kwargs["headers"] = {"Content-Type": "application/json"}
+
+            for attempt in range(self.retries + 1):
+                if multipart is not None:
+                    # Uploads are streamed, so every attempt needs a new body
+                    if attempt and not multipart.replayable:
+                        raise RuntimeError(
+                            f"Cannot retry {route} with files from async iterators"
+                        )
+                    kwargs["content"] = multipart.stream()
+
+                async with self.ratelimiter.acquire(route) as ticket:
+                    if ticket.waited:
+                        API_RATE_LIMIT_SLEEP.inc(ticket.waited, route=route.key)
+
+                    with API_LATENCY.time(route=route.key):
+                        r = await self._http.request(
+                            route.method, self._url(route.path), **kwargs
+                        )
+
+                    if r.status_code != 429:
+                        ticket.update(r.headers)
+                        break
+
+                    API_RATE_LIMITED.inc(route=route.key)
+                    ticket.rate_limited(r.headers, _error_body(r))
+
+            if r.is_error:
+                API_ERRORS.inc(route=route.key, status=str(r.status_code))
+            self._check(r)
+            return r
+
+    async def _get(self, route: Route):
+        r = await self._request(route)
+        return codec.loads(r.content)
+
+    async def _patch(self, route: Route, json=None, files=None):
+        r = await self._request(route, json=json, files=files)
+        return codec.loads(r.content)
+
+    async def _post(self, route: Route, json=None):
+        r = await self._request(route, json=json)
+        return codec.loads(r.content)
+
+    async def _put(self, route: Route, json=None):
+        r = await self._request(route, json=json)
+        return codec.loads(r.content)
+
+    async def _delete(self, route: Route):
+        await self._request(route)
+
+    async def get_global_application_commands(self, application_id):
+        return await self._get(
+            Route(
+                "GET",
+                "/applications/{application_id}/commands",
+                application_id=application_id,
+            )
+        )
+
+    async def create_global_application_command(self, application_id, body):
+        return await self._post(
+            Route(
+                "POST",
+                "/applications/{application_id}/commands",
+                application_id=application_id,
+            ),
+            json=body,
+        )
+
+    async def edit_global_application_command(self, application_id, command_id, body):
+        return await self._patch(
+            Route(
+                "PATCH",
+                "/applications/{application_id}/commands/{command_id}",
+                application_id=application_id,
+                command_id=command_id,
+            ),
+            json=body,
+        )
 
-    async def _get(self, path):
-        r = await self._http.get(self._url(path))
-        await self._check(r)
-        return r.json()
+    async def bulk_overwrite_global_application_commands(self, application_id, body):
+        return await self._put(
+            Route(
+                "PUT",
+                "/applications/{application_id}/commands",
+                application_id=application_id,
+            ),
+            json=body,
+        )
 
-    async def _patch(self, path, **kwargs):
-        r = await self._http.patch(self._url(path), **kwargs)
-        await self._check(r)
-        return r.json()
+    async def delete_global_application_command(self, application_id, command_id):
+        await self._delete(
+            Route(
+                "DELETE",
+                "/applications/{application_id}/commands/{command_id}",
+                application_id=application_id,
+                command_id=command_id,
+            )
+        )
 
-    async def _post(self, path, **kwargs):
-        r = await self._http.post(self._url(path), **kwargs)
-        await self._check(r)
-        return r.json()
+    async def get_guild_application_commands(self, application_id, guild_id):
+        return await self._get(
+            Route(
+                "GET",
+                "/applications/{application_id}/guilds/{guild_id}/commands",
+                application_id=application_id,
+                guild_id=guild_id,
+            )
+        )
 
-    async def _delete(self, path):
-        r = await self._http.delete(self._url(path))
-        await self._check(r)
+    async def create_guild_application_command(self, application_id, guild_id, body):
+        return await self._post(
+            Route(
+                "POST",
+                "/applications/{application_id}/guilds/{guild_id}/commands",
+                application_id=application_id,
+                guild_id=guild_id,
+            ),
+            json=body,
+        )
 
-    async def get_global_application_commands(self, application_id):
-        return await self._get(f"/applications/{application_id}/commands")
+    async def edit_guild_application_command(
+        self, application_id, guild_id, command_id, body
+    ):
+        return await self._patch(
+            Route(
+                "PATCH",
+                "/applications/{application_id}/guilds/{guild_id}/commands/{command_id}",
+                application_id=application_id,
+                guild_id=guild_id,
+                command_id=command_id,
+            ),
+            json=body,
+        )
 
-    async def create_global_application_command(self, application_id, body):
-        return await self._post(f"/applications/{application_id}/commands", json=body)
+    async def bulk_overwrite_guild_application_commands(
+        self, application_id, guild_id, body
+    ):
+        return await self._put(
+            Route(
+                "PUT",
+                "/applications/{application_id}/guilds/{guild_id}/commands",
+                application_id=application_id,
+                guild_id=guild_id,
+            ),
+            json=body,
+        )
 
-    async def delete_global_application_command(self, application_id, command_id):
-        await self._delete(f"/applications/{application_id}/commands/{command_id}")
+    async def delete_guild_application_command(
+        self, application_id, guild_id, command_id
+    ):
+        await self._delete(
+            Route(
+                "DELETE",
+                "/applications/{application_id}/guilds/{guild_id}/commands/{command_id}",
+                application_id=application_id,
+                guild_id=guild_id,
+                command_id=command_id,
+            )
+        )
+
+    def _original_interaction_response_route(self, application_id, interaction_token):
+        return Route(
+            "PATCH",
+            "/webhooks/{webhook_id}/{interaction_token}/messages/@original",
+            webhook_id=application_id,
+            interaction_token=interaction_token,
+        )
+
+    def edit_original_interaction_response_delay(
+        self, application_id, interaction_token
+    ) -> float:
+        return self.ratelimiter.delay(
+            self._original_interaction_response_route(application_id, interaction_token)
+        )
 
     async def edit_original_interaction_response(
-        self, application_id, interaction_token, body
+        self, application_id, interaction_token, body, files=None
     ):
         return await self._patch(
-            f"/webhooks/{application_id}/{interaction_token}/messages/@original",
+            self._original_interaction_response_route(
+                application_id, interaction_token
+            ),
             json=body,
+            files=files,
         )
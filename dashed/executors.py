@@ -0,0 +1,169 @@
+import asyncio
+import concurrent.futures
+import importlib.util
+import inspect
+import multiprocessing
+import os
+import pathlib
+import sys
+import time
+from typing import Any, Callable, Dict, Optional, Set, Tuple
+
+from dashed.metrics import EXECUTOR_QUEUE_WAIT
+
+EXECUTORS = ("thread", "process")
+
+# Modules loaded from files are registered under this prefix (see load_from_file)
+_RUNTIME_MODULE_PREFIX = "dashed.runtime.module."
+
+# Handler modules by path, with the mtime of the file they were loaded from.
+# The server records every module it loads, so forked pool workers start with
+# the initialized modules and only load files changed since the fork.
+_handler_modules: Dict[str, Tuple[float, Any]] = {}
+
+
+def remember_module(path: str, mtime: float, module):
+    _handler_modules[path] = (mtime, module)
+
+
+def _load_worker_module(path: str, mtime: float):
+    from dashed.loader import _RegistrationBuffers, _registration_buffers
+
+    loaded = _handler_modules.get(path)
+    if loaded is not None and loaded[0] == mtime:
+        return loaded[1]
+
+    name = f"{_RUNTIME_MODULE_PREFIX}{pathlib.Path(path).stem}"
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    token = _registration_buffers.set(_RegistrationBuffers())
+    try:
+        spec.loader.exec_module(module)
+        # Handlers may rely on what initialize() sets up, like in the server
+        if hasattr(module, "initialize"):
+            asyncio.run(module.initialize())
+    finally:
+        _registration_buffers.reset(token)
+    remember_module(path, mtime, module)
+    return module
+
+
+def _process_target(fn: Callable):
+    # Handlers loaded from files live in modules workers can't import by name
+    # (and may have been reloaded since the worker forked), so send where to
+    # find the handler instead of the function itself.
+    if not fn.__module__.startswith(_RUNTIME_MODULE_PREFIX):
+        return fn
+    path = fn.__code__.co_filename
+    return path, os.stat(path).st_mtime, fn.__qualname__
+
+
+def _resolve_target(target) -> Callable:
+    if callable(target):
+        return target
+    path, mtime, qualname = target
+    fn = _load_worker_module(path, mtime)
+    for name in qualname.split("."):
+        fn = getattr(fn, name)
+    return fn
+
+
+def _call(target, ctx, args: Dict[str, Any]) -> Tuple[float, Any]:
+    # Wall clock, so queue wait can be measured across processes
+    started = time.time()
+    result = _resolve_target(target)(ctx, **args)
+    if inspect.isawaitable(result):
+        result = asyncio.run(result)
+    return started, result
+
+
+def _noop():
+    pass
+
+
+class HandlerPool:
+    def __init__(self, kind: str, max_workers: Optional[int] = None):
+        assert kind in EXECUTORS, f"unknown executor {kind!r}"
+        cpus = os.cpu_count() or 1
+        self.kind = kind
+        self.max_workers = max_workers or (
+            min(32, cpus + 4) if kind == "thread" else cpus
+        )
+        self.in_flight = 0
+        self._executor: Optional[concurrent.futures.Executor] = None
+        # Submitted calls, so shutdown can cancel the queued ones
+        self._futures: Set[concurrent.futures.Future] = set()
+
+    @property
+    def busy(self) -> int:
+        return min(self.in_flight, self.max_workers)
+
+    @property
+    def queued(self) -> int:
+        return max(0, self.in_flight - self.max_workers)
+
+    @property
+    def executor(self) -> concurrent.futures.Executor:
+        if self._executor is None:
+            if self.kind == "thread":
+                self._executor = concurrent.futures.ThreadPoolExecutor(
+                    self.max_workers, thread_name_prefix="dashed-handler"
+                )
+            else:
+                # Forked workers start with every module the server has
+                # already imported, and with fork all of them are started on
+                # the first submit.
+                self._executor = concurrent.futures.ProcessPoolExecutor(
+                    self.max_workers, mp_context=multiprocessing.get_context("fork")
+                )
+        return self._executor
+
+    async def start(self):
+        await asyncio.get_running_loop().run_in_executor(self.executor, _noop)
+
+    async def run(self, fn: Callable, ctx, args: Dict[str, Any]) -> Any:
+        target = _process_target(fn) if self.kind == "process" else fn
+        submitted = time.time()
+        self.in_flight += 1
+        future = self.executor.submit(_call, target, ctx, args)
+        self._futures.add(future)
+        future.add_done_callback(self._futures.discard)
+        try:
+            started, result = await asyncio.wrap_future(future)
+        finally:
+            self.in_flight -= 1
+        EXECUTOR_QUEUE_WAIT.observe(max(0.0, started - submitted), executor=self.kind)
+        return result
+
+    def shutdown(self, wait: bool = True):
+        if self._executor is not None:
+            if sys.version_info >= (3, 9):
+                self._executor.shutdown(wait=wait, cancel_futures=True)
+            else:
+                # cancel_futures is new in Python 3.9, calls that already
+                # started can't be cancelled either way.
+                for future in list(self._futures):
+                    future.cancel()
+                self._executor.shutdown(wait=wait)
+            self._executor = None
+
+
+class HandlerPools:
+    def __init__(
+        self,
+        thread_workers: Optional[int] = None,
+        process_workers: Optional[int] = None,
+    ):
+        self.thread = HandlerPool("thread", thread_workers)
+        self.process = HandlerPool("process", process_workers)
+
+    def __iter__(self):
+        return iter((self.thread, self.process))
+
+    def get(self, kind: str) -> HandlerPool:
+        return self.thread if kind == "thread" else self.process
+
+    def shutdown(self, wait: bool = True):
+        for pool in self:
+            pool.shutdown(wait)
@@ -0,0 +1,279 @@
+import asyncio
+import dataclasses
+import hashlib
+import itertools
+import random
+import time
+from typing import Any, Dict, Tuple
+
+from aiohttp import web
+
+from dashed import codec
+
+
+@dataclasses.dataclass
+class FakeDiscordConfig:
+    latency: float = 0.05
+    jitter: float = 0.02
+    global_limit: int = 50
+    command_limit: int = 5
+    command_window: float = 20.0
+    webhook_limit: int = 5
+    webhook_window: float = 2.0
+
+
+@dataclasses.dataclass
+class FakeDiscordStats:
+    requests: int = 0
+    rate_limited: int = 0
+    global_rate_limited: int = 0
+    requests_by_route: Dict[str, int] = dataclasses.field(default_factory=dict)
+
+
+class _Window:
+    __slots__ = ("count", "reset_at")
+
+    def __init__(self):
+        self.count = 0
+        self.reset_at = 0.0
+
+    def hit(self, limit: int, window: float, now: float) -> Tuple[bool, int, float]:
+        if now >= self.reset_at:
+            self.count = 0
+            self.reset_at = now + window
+        self.count += 1
+        return self.count <= limit, max(limit - self.count, 0), self.reset_at - now
+
+
+def _json(data: Any, status: int = 200, headers=None) -> web.Response:
+    return web.Response(
+        body=codec.dumps(data),
+        status=status,
+        content_type="application/json",
+        headers=headers,
+    )
+
+
+class FakeDiscord:
+    def __init__(self, config: FakeDiscordConfig):
+        self.config = config
+        self.stats = FakeDiscordStats()
+        self.commands: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        self.messages: Dict[str, Dict[str, Any]] = {}
+
+        self._ids = itertools.count(800000000000000000)
+        self._global = _Window()
+        self._buckets: Dict[Tuple[str, str], _Window] = {}
+
+    def _bucket_limit(self, kind: str) -> Tuple[int, float]:
+        if kind == "webhook":
+            return self.config.webhook_limit, self.config.webhook_window
+        return self.config.command_limit, self.config.command_window
+
+    @web.middleware
+    async def middleware(self, request: web.Request, handler):
+        # Unknown routes fall through to aiohttp's 404 (or 405)
+        resource = request.match_info.route.resource
+        if resource is None or request.path.startswith("/_"):
+            return await handler(request)
+
+        delay = self.config.latency + random.uniform(
+            -self.config.jitter, self.config.jitter
+        )
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+        route = resource.canonical
+        kind = "webhook" if "/webhooks/" in route else "commands"
+        major = request.match_info.get("token") or request.match_info.get(
+            "guild_id", ""
+        )
+
+        self.stats.requests += 1
+        self.stats.requests_by_route[route] = (
+            self.stats.requests_by_route.get(route, 0) + 1
+        )
+
+        now = time.monotonic()
+
+        # Like Discord, interaction webhooks are exempt from the global limit
+        if kind != "webhook":
+            allowed, _, reset_after = self._global.hit(
+                self.config.global_limit, 1.0, now
+            )
+        else:
+            allowed = True
+
+        if not allowed:
+            self.stats.rate_limited += 1
+            self.stats.global_rate_limited += 1
+            return _json(
+                {
+                    "message": "You are being rate limited.",
+                    "retry_after": reset_after,
+                    "global": True,
+                },
+                status=429,
+                headers={
+                    "Retry-After": f"{reset_after:.3f}",
+                    "X-RateLimit-Global": "true",
+                    "X-RateLimit-Scope": "global",
+                },
+            )
+
+        limit, window = self._bucket_limit(kind)
+        route_key = f"{request.method} {route}".encode("utf-8")
+        bucket_hash = hashlib.sha1(route_key).hexdigest()[:16]
+        bucket = self._buckets.setdefault((bucket_hash, major), _Window())
+        allowed, remaining, reset_after = bucket.hit(limit, window, now)
+        headers = {
+            "X-RateLimit-Limit": str(limit),
+            "X-RateLimit-Remaining": str(remaining),
+            "X-RateLimit-Reset": f"{time.time() + reset_after:.3f}",
+            "X-RateLimit-Reset-After": f"{reset_after:.3f}",
+            "X-RateLimit-Bucket": bucket_hash,
+        }
+
+        if not allowed:
+            self.stats.rate_limited += 1
+            return _json(
+                {
+                    "message": "You are being rate limited.",
+                    "retry_after": reset_after,
+                    "global": False,
+                },
+                status=429,
+                headers=dict(
+                    headers,
+                    **{
+                        "Retry-After": f"{reset_after:.3f}",
+                        "X-RateLimit-Scope": "user",
+                    },
+                ),
+            )
+
+        response = await handler(request)
+        response.headers.update(headers)
+        return response
+
+    def _scope(self, request: web.Request) -> str:
+        # Guild commands are kept separately from global ones
+        application_id = request.match_info["application_id"]
+        guild_id = request.match_info.get("guild_id")
+        return application_id if guild_id is None else f"{application_id}:{guild_id}"
+
+    def _command(self, application_id: str, body: Dict[str, Any], command_id=None):
+        return dict(
+            body,
+            id=command_id or str(next(self._ids)),
+            application_id=application_id,
+            version=str(next(self._ids)),
+        )
+
+    async def get_commands(self, request: web.Request):
+        commands = self.commands.get(self._scope(request), {})
+        return _json(list(commands.values()))
+
+    async def create_command(self, request: web.Request):
+        application_id = request.match_info["application_id"]
+        commands = self.commands.setdefault(self._scope(request), {})
+        body = codec.loads(await request.read())
+
+        # Creating a command with an existing name overwrites it
+        existing = {command["name"]: id for id, command in commands.items()}
+        command = self._command(application_id, body, existing.get(body["name"]))
+        commands[command["id"]] = command
+        return _json(command, status=201)
+
+    async def overwrite_commands(self, request: web.Request):
+        application_id = request.match_info["application_id"]
+        body = codec.loads(await request.read())
+        commands = self.commands[self._scope(request)] = {
+            command["id"]: command
+            for command in (self._command(application_id, c) for c in body)
+        }
+        return _json(list(commands.values()))
+
+    async def edit_command(self, request: web.Request):
+        application_id = request.match_info["application_id"]
+        command_id = request.match_info["command_id"]
+        commands = self.commands.get(self._scope(request), {})
+        if command_id not in commands:
+            return _json({"message": "Unknown application command"}, status=404)
+
+        body = codec.loads(await request.read())
+        commands[command_id] = self._command(
+            application_id, dict(commands[command_id], **body), command_id
+        )
+        return _json(commands[command_id])
+
+    async def delete_command(self, request: web.Request):
+        commands = self.commands.get(self._scope(request), {})
+        if commands.pop(request.match_info["command_id"], None) is None:
+            return _json({"message": "Unknown application command"}, status=404)
+        return web.Response(status=204)
+
+    async def edit_original_message(self, request: web.Request):
+        token = request.match_info["token"]
+        message = self.messages.setdefault(token, {"id": str(next(self._ids))})
+        if request.content_type != "multipart/form-data":
+            message.update(codec.loads(await request.read()))
+            return _json(message)
+
+        # Uploads are counted, not kept
+        attachments = []
+        async for part in await request.multipart():
+            if part.name == "payload_json":
+                message.update(codec.loads(await part.read()))
+                continue
+
+            size = 0
+            while True:
+                chunk = await part.read_chunk()
+                if not chunk:
+                    break
+                size += len(chunk)
+            attachments.append(
+                {"id": str(next(self._ids)), "filename": part.filename, "size": size}
+            )
+        message["attachments"] = attachments
+        return _json(message)
+
+    async def get_gateway(self, request: web.Request):
+        return _json({"url": "wss://gateway.discord.gg"})
+
+    async def get_stats(self, request: web.Request):
+        return _json(dataclasses.asdict(self.stats))
+
+    def application(self) -> web.Application:
+        app = web.Application(middlewares=[self.middleware])
+        routes = []
+        for commands in (
+            "/api/v8/applications/{application_id}/commands",
+            "/api/v8/applications/{application_id}/guilds/{guild_id}/commands",
+        ):
+            routes += [
+                web.get(commands, self.get_commands),
+                web.post(commands, self.create_command),
+                web.put(commands, self.overwrite_commands),
+                web.patch(commands + "/{command_id}", self.edit_command),
+                web.delete(commands + "/{command_id}", self.delete_command),
+            ]
+        app.add_routes(
+            routes
+            + [
+                web.patch(
+                    "/api/v8/webhooks/{application_id}/{token}/messages/@original",
+                    self.edit_original_message,
+                ),
+                web.get("/api/v8/gateway", self.get_gateway),
+                web.get("/_stats", self.get_stats),
+            ]
+        )
+        return app
+
+
+async def run(host: str, port: int, config: FakeDiscordConfig):
+    fake = FakeDiscord(config)
+    print(f"Fake Discord API available at http://{host}:{port}/api/v8")
+    await web._run_app(fake.application(), host=host, port=port, print=None)
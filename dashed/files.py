@@ -0,0 +1,142 @@
+import asyncio
+import os
+import pathlib
+import secrets
+from typing import Any, AsyncIterator, Dict, List, Optional, Union
+
+from dashed import codec
+
+CHUNK_SIZE = 64 * 1024
+
+FileSource = Union[bytes, bytearray, memoryview, str, os.PathLike, AsyncIterator[bytes]]
+
+
+class File:
+    # An attachment uploaded with a message. Bytes and memoryviews are sent
+    # in slices of the original buffer, paths are read in chunks while the
+    # request is sent and async iterators are passed through, so nothing is
+    # loaded (or copied) in full.
+    def __init__(
+        self,
+        source: FileSource,
+        filename: Optional[str] = None,
+        content_type: str = "application/octet-stream",
+        chunk_size: int = CHUNK_SIZE,
+    ):
+        if isinstance(source, (str, os.PathLike)):
+            source = pathlib.Path(source)
+            filename = filename or source.name
+        assert filename, "files that aren't read from a path need a filename"
+        # Both end up in the part's headers, where a line break would start a
+        # new header (or the body).
+        for value in (filename, content_type):
+            if any(ord(c) < 32 or ord(c) == 127 for c in value):
+                raise ValueError(f"control character in {value!r}")
+
+        self.source = source
+        self.filename = filename
+        self.content_type = content_type
+        self.chunk_size = chunk_size
+
+    @property
+    def size(self) -> Optional[int]:
+        if isinstance(self.source, (bytes, bytearray, memoryview)):
+            return memoryview(self.source).nbytes
+        elif isinstance(self.source, pathlib.Path):
+            return self.source.stat().st_size
+        return None
+
+    @property
+    def replayable(self) -> bool:
+        # An async iterator can only be sent once
+        return isinstance(self.source, (bytes, bytearray, memoryview, pathlib.Path))
+
+    async def chunks(self) -> AsyncIterator[Any]:
+        if isinstance(self.source, (bytes, bytearray, memoryview)):
+            view = memoryview(self.source).cast("B")
+            for offset in range(0, len(view), self.chunk_size):
+                yield view[offset : offset + self.chunk_size]
+        elif isinstance(self.source, pathlib.Path):
+            # Disk reads run in the default executor, off the event loop
+            loop = asyncio.get_running_loop()
+            f = await loop.run_in_executor(None, self.source.open, "rb")
+            try:
+                while True:
+                    chunk = await loop.run_in_executor(None, f.read, self.chunk_size)
+                    if not chunk:
+                        break
+                    yield chunk
+            finally:
+                f.close()
+        else:
+            async for chunk in self.source:
+                yield chunk
+
+
+def _quote(value: str) -> str:
+    # Control characters are rejected by File, only quotes need escaping
+    return value.replace("\\", "\\\\").replace('"', "%22")
+
+
+class MultipartBody:
+    # multipart/form-data with the JSON payload in `payload_json` and every
+    # file in a `files[n]` part, like Discord expects message uploads.
+    def __init__(self, payload: Optional[Dict[str, Any]], files: List[File]):
+        self.files = files
+        self.boundary = secrets.token_hex(16)
+        self._payload = codec.dumps(payload or {})
+        self._headers = [
+            (
+                f"--{self.boundary}\r\n"
+                f'Content-Disposition: form-data; name="files[{index}]"; '
+                f'filename="{_quote(file.filename)}"\r\n'
+                f"Content-Type: {file.content_type}\r\n\r\n"
+            ).encode("utf-8")
+            for index, file in enumerate(files)
+        ]
+        self._payload_header = (
+            f"--{self.boundary}\r\n"
+            'Content-Disposition: form-data; name="payload_json"\r\n'
+            "Content-Type: application/json\r\n\r\n"
+        ).encode("utf-8")
+        self._end = f"--{self.boundary}--\r\n".encode("utf-8")
+
+    @property
+    def content_type(self) -> str:
+        return f"multipart/form-data; boundary={self.boundary}"
+
+    @property
+    def size(self) -> Optional[int]:
+        sizes = [file.size for file in self.files]
+        if None in sizes:
+            return None
+        return (
+            len(self._payload_header)
+            + len(self._payload)
+            + 2
+            + sum(len(header) + size + 2 for header, size in zip(self._headers, sizes))
+            + len(self._end)
+        )
+
+    @property
+    def replayable(self) -> bool:
+        return all(file.replayable for file in self.files)
+
+    @property
+    def headers(self) -> Dict[str, str]:
+        headers = {"Content-Type": self.content_type}
+        size = self.size
+        if size is not None:
+            headers["Content-Length"] = str(size)
+        return headers
+
+    async def stream(self) -> AsyncIterator[Any]:
+        yield self._payload_header
+        yield self._payload
+        yield b"\r\n"
+        for header, file in zip(self._headers, self.files):
+            yield header
+            async for chunk in file.chunks():
+                yield chunk
+            yield b"\r\n"
+        yield self._end
@@ -0,0 +1,101 @@
+import contextlib
+import contextvars
+import dataclasses
+import secrets
+import time
+from typing import Awaitable, Callable, List, Optional
+
+STAGES = ("request", "verify", "parse", "dispatch", "handler", "serialize", "api")
+
+_trace_id: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar(
+    "dashed_trace_id", default=None
+)
+
+
+def current_trace_id() -> Optional[str]:
+    return _trace_id.get()
+
+
+def new_trace_id() -> str:
+    return secrets.token_hex(8)
+
+
+async def traced(trace_id: Optional[str], awaitable: Awaitable):
+    # Deferred work runs in scheduler tasks, which don't inherit the context
+    # of the request that submitted it.
+    token = _trace_id.set(trace_id)
+    try:
+        return await awaitable
+    finally:
+        _trace_id.reset(token)
+
+
+@dataclasses.dataclass
+class StageEvent:
+    stage: str
+    name: Optional[str]
+    trace_id: Optional[str]
+    started: float
+    finished: Optional[float] = None
+    error: Optional[BaseException] = None
+
+    @property
+    def duration(self) -> float:
+        return (self.finished or time.monotonic()) - self.started
+
+
+Callback = Callable[[StageEvent], None]
+
+
+class _Stage:
+    __slots__ = ("hooks", "event")
+
+    def __init__(self, hooks: "Hooks", stage: str, name: Optional[str]):
+        self.hooks = hooks
+        self.event = StageEvent(stage, name, _trace_id.get(), 0.0)
+
+    def __enter__(self) -> StageEvent:
+        self.event.started = time.monotonic()
+        for callback in self.hooks._before:
+            callback(self.event)
+        return self.event
+
+    def __exit__(self, exc_type, exc, tb):
+        self.event.finished = time.monotonic()
+        self.event.error = exc
+        for callback in self.hooks._after:
+            callback(self.event)
+
+
+_NOOP = contextlib.nullcontext()
+
+
+# Callbacks run inline around each stage of handling an interaction and
+# around every Discord API request, so they should be cheap. Before and after
+# callbacks get the same StageEvent, `finished` and `error` are only set for
+# the latter.
+class Hooks:
+    def __init__(self):
+        self._before: List[Callback] = []
+        self._after: List[Callback] = []
+
+    @property
+    def active(self) -> bool:
+        return bool(self._before or self._after)
+
+    def before(self, fn: Callback) -> Callback:
+        self._before.append(fn)
+        return fn
+
+    def after(self, fn: Callback) -> Callback:
+        self._after.append(fn)
+        return fn
+
+    def remove(self, fn: Callback):
+        self._before = [callback for callback in self._before if callback != fn]
+        self._after = [callback for callback in self._after if callback != fn]
+
+    def stage(self, stage: str, name: Optional[str] = None):
+        if not self.active:
+            return _NOOP
+        return _Stage(self, stage, name)
@@ -1,7 +1,11 @@
 import asyncio
+import inspect
+
+from dashed.files import File
 from dashed.loader import DashedContext
-import dataclasses
-from typing import Any, Dict
+from dashed.serialize import encode
+from dashed.streaming import ResponseStream
+from typing import Any, AsyncIterator, Dict, List, Optional
 from .discord import (
     ApplicationCommandCallbackData,
     InteractionResponseType,
@@ -9,23 +13,116 @@ from .discord import (
 )
 
 
+def _running_loop() -> Optional[asyncio.AbstractEventLoop]:
+    try:
+        return asyncio.get_running_loop()
+    except RuntimeError:
+        return None
+
+
+def _as_files(files: List[Any]) -> List[File]:
+    return [file if isinstance(file, File) else File(file) for file in files]
+
+
 class InteractionContext:
     def __init__(self, ctx: DashedContext, data: Dict[str, Any]):
         self.ctx = ctx
         self.data = data
+        # The server's loop, deferred tasks are scheduled on it even when the
+        # handler runs in the thread pool
+        self._loop = _running_loop()
 
-    def reply(self, **kwargs):
-        return {
+    def __getstate__(self):
+        # Handlers in a process pool get the interaction without the server
+        # context, its client and pools can't cross the process boundary.
+        return dict(self.__dict__, ctx=None, _loop=None)
+
+    def reply(self, *, files: Optional[List[Any]] = None, **kwargs):
+        result = {
             "type": InteractionResponseType.CHANNEL_MESSAGE_WITH_SOURCE,
-            "data": dataclasses.asdict(ApplicationCommandCallbackData(**kwargs)),
+            "data": encode(ApplicationCommandCallbackData(**kwargs)),
         }
+        if files:
+            # Uploaded by editing the (deferred) response, see _handle_command
+            result["files"] = _as_files(files)
+        return result
+
+    @property
+    def name(self) -> str:
+        return self.data["data"]["name"]
+
+    def _defer(self, fn, deferred_context, response_type, priority, timeout):
+        if inspect.isasyncgenfunction(fn):
+            call = lambda: deferred_context.consume(fn(deferred_context))
+        else:
+            call = lambda: fn(deferred_context)
+
+        def submit():
+            self.ctx.scheduler.submit(
+                call,
+                name=self.name,
+                priority=priority,
+                timeout=timeout,
+            )
+
+        # SchedulerFull propagates to the server, which answers with a 503
+        if self._loop is None or _running_loop() is self._loop:
+            submit()
+        else:
+            # The scheduler isn't thread safe, so a handler in the thread pool
+            # waits for the loop to queue the task.
+            async def submit_on_loop():
+                submit()
+
+            asyncio.run_coroutine_threadsafe(submit_on_loop(), self._loop).result()
+        return {"type": response_type}
+
+    def defer(self, fn, *, priority: int = 0, timeout: Optional[float] = None):
+        return self._defer(
+            fn,
+            DeferredInteractionContext(self),
+            InteractionResponseType.DEFERRED_CHANNEL_MESSAGE_WITH_SOURCE,
+            priority,
+            timeout,
+        )
+
+
+class ComponentContext(InteractionContext):
+    def __init__(self, ctx: DashedContext, data: Dict[str, Any], pattern: str):
+        super().__init__(ctx, data)
+        self.pattern = pattern
+
+    @property
+    def name(self) -> str:
+        return self.pattern
+
+    @property
+    def custom_id(self) -> str:
+        return self.data["data"]["custom_id"]
+
+    @property
+    def values(self) -> List[str]:
+        return self.data["data"].get("values", [])
+
+    @property
+    def message(self) -> Optional[Dict[str, Any]]:
+        return self.data.get("message")
 
-    def defer(self, fn):
-        asyncio.ensure_future(fn(DeferredInteractionContext(self)))
+    def update(self, **kwargs):
         return {
-            "type": InteractionResponseType.DEFERRED_CHANNEL_MESSAGE_WITH_SOURCE,
+            "type": InteractionResponseType.UPDATE_MESSAGE,
+            "data": encode(ApplicationCommandCallbackData(**kwargs)),
         }
 
+    def defer_update(self, fn, *, priority: int = 0, timeout: Optional[float] = None):
+        return self._defer(
+            fn,
+            DeferredComponentContext(self),
+            InteractionResponseType.DEFERRED_UPDATE_MESSAGE,
+            priority,
+            timeout,
+        )
+
 
 class DeferredInteractionContext:
     def __init__(self, original_interaction_context):
@@ -39,9 +136,58 @@ class DeferredInteractionContext:
     def data(self):
         return self.original_interaction_context.data
 
-    async def update(self, **kwargs):
+    async def update(self, *, files: Optional[List[Any]] = None, **kwargs):
         await self.ctx.client.edit_original_interaction_response(
             self.data["application_id"],
             self.data["token"],
-            dataclasses.asdict(WebhookEditBody(**kwargs)),
+            encode(WebhookEditBody(**kwargs)),
+            files=_as_files(files) if files else None,
+        )
+
+    def stream(self, interval: float = 1.0) -> "InteractionStream":
+        return InteractionStream(self, interval)
+
+    async def consume(self, updates: AsyncIterator[Any], interval: float = 1.0):
+        async with self.stream(interval) as stream:
+            async for update in updates:
+                if isinstance(update, str):
+                    stream.update(content=update)
+                elif isinstance(update, WebhookEditBody):
+                    stream.push(encode(update))
+                else:
+                    stream.update(**update)
+
+
+class InteractionStream(ResponseStream):
+    def __init__(self, context: DeferredInteractionContext, interval: float):
+        client = context.ctx.client
+        application_id = context.data["application_id"]
+        token = context.data["token"]
+        super().__init__(
+            lambda body: client.edit_original_interaction_response(
+                application_id, token, body
+            ),
+            lambda: client.edit_original_interaction_response_delay(
+                application_id, token
+            ),
+            interval,
         )
+
+    def update(self, **kwargs):
+        self.push(encode(WebhookEditBody(**kwargs)))
+
+
+class DeferredComponentContext(DeferredInteractionContext):
+    # After a deferred update the original response is the message that
+    # holds the component, so update() edits that message in place.
+    @property
+    def custom_id(self) -> str:
+        return self.original_interaction_context.custom_id
+
+    @property
+    def values(self) -> List[str]:
+        return self.original_interaction_context.values
+
+    @property
+    def message(self) -> Optional[Dict[str, Any]]:
+        return self.original_interaction_context.message
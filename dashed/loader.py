@@ -1,47 +1,136 @@
+import asyncio
+import contextvars
 import dataclasses
 import inspect
 import pathlib
+import sys
+import time
+import types
 import typing
-from typing import Any, Dict, List, Optional, OrderedDict, Tuple, Union
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Dict,
+    List,
+    Mapping,
+    Optional,
+    OrderedDict,
+    Tuple,
+    Union,
+)
 
+from dashed.cache import AsyncTTLCache, ResponseCache
+from dashed.components import ComponentRouter
 from dashed.discord import (
     ApplicationCommandDescription,
     ApplicationCommandOption,
+    ApplicationCommandOptionChoice,
     ApplicationCommandOptionType,
     Channel,
     DiscordAPIClient,
+    Member,
     Mentionable,
     Role,
     User,
 )
+from dashed.executors import EXECUTORS, HandlerPools, remember_module
+from dashed.hooks import Hooks
+from dashed.scheduler import Scheduler
+from dashed.serialize import encode
+from dashed.sync import (
+    GuildSyncResult,
+    SchemaCache,
+    SyncResult,
+    sync_commands,
+    sync_guild_commands,
+)
+from dashed.verify import SignatureVerifier
+
+
+class _RegistrationBuffers:
+    def __init__(self):
+        self.commands = []
+        self.groups = []
+        self.components = []
+
 
-_registered_groups_buffer = []
-_registered_commands_buffer = []
+# Decorators register into the buffers of the current context. Each module
+# load gets its own buffers, so modules can initialize concurrently without
+# picking up each other's registrations.
+_registration_buffers = contextvars.ContextVar(
+    "dashed_registration_buffers", default=_RegistrationBuffers()
+)
 
 
 def _flush_registered_commands_buffer() -> List:
-    global _registered_commands_buffer
-    result = _registered_commands_buffer
-    _registered_commands_buffer = []
+    buffers = _registration_buffers.get()
+    result = buffers.commands
+    buffers.commands = []
     return result
 
 
-def command(*, description: str, name: Optional[str] = None):
-    global _registered_commands_buffer
-
+def command(
+    *,
+    description: str,
+    name: Optional[str] = None,
+    timeout: Optional[float] = None,
+    priority: int = 0,
+    executor: Optional[str] = None,
+    cache: Union[bool, ResponseCache, None] = None,
+    ephemeral: bool = False,
+):
     def command_decorator(fn):
-        _registered_commands_buffer.append(
-            DashedCommand(name=name or fn.__name__, description=description, fn=fn)
+        _registration_buffers.get().commands.append(
+            DashedCommand(
+                name=name or fn.__name__,
+                description=description,
+                fn=fn,
+                timeout=timeout,
+                priority=priority,
+                executor=executor,
+                cache=cache,
+                ephemeral=ephemeral,
+            )
         )
         return fn
 
     return command_decorator
 
 
+def _flush_registered_components_buffer() -> List:
+    buffers = _registration_buffers.get()
+    result = buffers.components
+    buffers.components = []
+    return result
+
+
+def component(
+    pattern: str,
+    *,
+    timeout: Optional[float] = None,
+    priority: int = 0,
+    executor: Optional[str] = None,
+):
+    def component_decorator(fn):
+        _registration_buffers.get().components.append(
+            DashedComponent(
+                pattern=pattern,
+                fn=fn,
+                timeout=timeout,
+                priority=priority,
+                executor=executor,
+            )
+        )
+        return fn
+
+    return component_decorator
+
+
 def _flush_registered_groups_buffer() -> List:
-    global _registered_groups_buffer
-    result = _registered_groups_buffer
-    _registered_groups_buffer = []
+    buffers = _registration_buffers.get()
+    result = buffers.groups
+    buffers.groups = []
     return result
 
 
@@ -51,6 +140,63 @@ class TypeWithChoices:
         self.choices = choices
 
 
+# Discord shows at most 25 suggestions
+_MAX_AUTOCOMPLETE_CHOICES = 25
+
+
+def _normalize_choices(choices) -> List[Dict[str, Any]]:
+    if isinstance(choices, dict):
+        return [{"name": k, "value": v} for k, v in choices.items()][
+            :_MAX_AUTOCOMPLETE_CHOICES
+        ]
+
+    result = []
+    for choice in choices:
+        if isinstance(choice, ApplicationCommandOptionChoice):
+            result.append(encode(choice))
+        elif isinstance(choice, dict):
+            result.append(choice)
+        else:
+            result.append({"name": str(choice), "value": choice})
+
+        if len(result) == _MAX_AUTOCOMPLETE_CHOICES:
+            break
+    return result
+
+
+class Autocomplete:
+    def __init__(
+        self,
+        inner_type: type,
+        fn: Callable[[Any, Any], Any],
+        *,
+        cache: bool = True,
+        ttl: Optional[float] = 60.0,
+        max_size: int = 1024,
+    ):
+        assert inner_type in (str, int), "only str and int options can autocomplete"
+        self.inner_type = inner_type
+        self.fn = fn
+        self.cache = (
+            AsyncTTLCache(f"autocomplete:{fn.__name__}", max_size=max_size, ttl=ttl)
+            if cache
+            else None
+        )
+
+    async def _complete(self, ctx, value) -> List[Dict[str, Any]]:
+        return _normalize_choices(await self.fn(ctx, value))
+
+    async def complete(self, ctx, path: str, option: str, value: Any):
+        if self.cache is None:
+            return await self._complete(ctx, value)
+
+        # Suggestions are shared between everyone typing the same input into
+        # the same option.
+        return await self.cache.get_or_compute(
+            (path, option, value), lambda: self._complete(ctx, value)
+        )
+
+
 @dataclasses.dataclass
 class Group:
     name: str
@@ -68,36 +214,104 @@ class Group:
         return self.children[target_name].lookup(options[0]["options"])
 
     def __post_init__(self):
-        global _registered_groups_buffer
-        _registered_groups_buffer.append(self)
+        _registration_buffers.get().groups.append(self)
 
     def subgroup(self, name: str, description: str):
         group = Group(name=name, description=description)
+        # Subgroups are reached through their parent, not registered on their own
+        buffers = _registration_buffers.get()
+        buffers.groups = [g for g in buffers.groups if g is not group]
         self.children[name] = group
         return group
 
-    def command(self, *, description: str, name: Optional[str] = None):
+    def command(
+        self,
+        *,
+        description: str,
+        name: Optional[str] = None,
+        timeout: Optional[float] = None,
+        priority: int = 0,
+        executor: Optional[str] = None,
+        cache: Union[bool, ResponseCache, None] = None,
+        ephemeral: bool = False,
+    ):
         def command_decorator(fn):
             self.commands[name or fn.__name__] = DashedCommand(
-                name=name or fn.__name__, description=description, fn=fn
+                name=name or fn.__name__,
+                description=description,
+                fn=fn,
+                timeout=timeout,
+                priority=priority,
+                executor=executor,
+                cache=cache,
+                ephemeral=ephemeral,
             )
             return fn
 
         return command_decorator
 
 
+def _get_executor(fn, executor: Optional[str], streaming: bool) -> Optional[str]:
+    # Synchronous handlers would block the event loop, run them in threads
+    if executor is None and not (streaming or inspect.iscoroutinefunction(fn)):
+        return "thread"
+    assert executor is None or executor in EXECUTORS, f"unknown executor {executor!r}"
+    assert not (streaming and executor), "streaming handlers run on the event loop"
+    return executor
+
+
 @dataclasses.dataclass
 class DashedCommand:
     name: str
     description: str
     fn: Any
     deferred: bool = False
+    streaming: bool = False
+    timeout: Optional[float] = None
+    priority: int = 0
+    executor: Optional[str] = None
+    # cache=True keeps replies in this worker process only, with --workers
+    # each worker caches separately unless the ResponseCache has a shared
+    # backend.
+    cache: Optional[ResponseCache] = None
+    # Replies are ephemeral, whether sent right away or after a deferred response
+    ephemeral: bool = False
 
     def __post_init__(self):
         from dashed.interaction import DeferredInteractionContext
 
         hints = typing.get_type_hints(self.fn)
-        self.deferred = hints["ctx"] == DeferredInteractionContext
+        self.streaming = inspect.isasyncgenfunction(self.fn)
+        self.deferred = self.streaming or hints["ctx"] == DeferredInteractionContext
+        self.executor = _get_executor(self.fn, self.executor, self.streaming)
+
+        if self.cache is True:
+            self.cache = ResponseCache()
+        elif self.cache is False:
+            self.cache = None
+        if self.cache is not None:
+            assert not self.deferred, "only replies of non-deferred commands are cached"
+            if self.cache.name is None:
+                self.cache.name = f"{self.fn.__module__}.{self.fn.__qualname__}"
+
+
+@dataclasses.dataclass
+class DashedComponent:
+    pattern: str
+    fn: Any
+    deferred: bool = False
+    streaming: bool = False
+    timeout: Optional[float] = None
+    priority: int = 0
+    executor: Optional[str] = None
+
+    def __post_init__(self):
+        from dashed.interaction import DeferredComponentContext
+
+        hints = typing.get_type_hints(self.fn)
+        self.streaming = inspect.isasyncgenfunction(self.fn)
+        self.deferred = self.streaming or hints["ctx"] == DeferredComponentContext
+        self.executor = _get_executor(self.fn, self.executor, self.streaming)
 
 
 @dataclasses.dataclass
@@ -105,47 +319,386 @@ class DashedModule:
     name: str
     commands: List[DashedCommand]
     groups: List[Group]
+    components: List[DashedComponent] = dataclasses.field(default_factory=list)
+    path: Optional[pathlib.Path] = None
+    mtime: float = 0.0
+    import_seconds: float = 0.0
+    initialize_seconds: float = 0.0
+    # Imports a module described by the manifest, see load_manifest
+    load: Optional[Callable[[], Awaitable["DashedModule"]]] = dataclasses.field(
+        default=None, repr=False
+    )
+
+
+class MissingOptionError(Exception):
+    pass
+
+
+@dataclasses.dataclass(frozen=True)
+class CompiledCommand:
+    path: str
+    command: DashedCommand
+    converters: Mapping[str, Optional[Callable[[Dict[str, Any], Any], Any]]]
+    required: Tuple[str, ...]
+    autocomplete: Mapping[str, Autocomplete]
+
+    def decode(
+        self, resolved: Dict[str, Any], options: List[Dict[str, Any]]
+    ) -> Dict[str, Any]:
+        converters = self.converters
+        args = {}
+        for option in options:
+            name = option["name"]
+            if name not in converters:
+                continue
+
+            converter = converters[name]
+            if converter is None:
+                args[name] = option["value"]
+            else:
+                args[name] = converter(resolved, option["value"])
+
+        for name in self.required:
+            if name not in args:
+                raise MissingOptionError(
+                    f"missing required option {name!r} for {self.path}"
+                )
+
+        return args
+
+
+def _resolve_user(resolved: Dict[str, Any], value: str) -> User:
+    members = resolved.get("members")
+    return User(resolved["users"][value], members.get(value) if members else None)
+
+
+def _resolve_member(resolved: Dict[str, Any], value: str) -> Union[Member, User]:
+    # There are no members outside of guilds, DMs only resolve the user
+    member = resolved.get("members", {}).get(value)
+    if member is None:
+        return User(resolved["users"][value])
+    return Member(member, resolved["users"][value])
+
+
+def _resolve_channel(resolved: Dict[str, Any], value: str) -> Channel:
+    return Channel(resolved["channels"][value])
+
+
+def _resolve_role(resolved: Dict[str, Any], value: str) -> Role:
+    return Role(resolved["roles"][value])
+
+
+def _resolve_mentionable(resolved: Dict[str, Any], value: str) -> Mentionable:
+    if value in resolved.get("users", {}):
+        return _resolve_user(resolved, value)
+    return _resolve_role(resolved, value)
+
+
+_OPTION_CONVERTERS = {
+    User: _resolve_user,
+    Member: _resolve_member,
+    Channel: _resolve_channel,
+    Role: _resolve_role,
+    Mentionable: _resolve_mentionable,
+}
+
+
+def _get_option_converter(
+    type_: Any,
+) -> Optional[Callable[[Dict[str, Any], Any], Any]]:
+    if isinstance(type_, type):
+        return _OPTION_CONVERTERS.get(type_)
+    return None
+
+
+def _compile_command(path: str, command: DashedCommand) -> CompiledCommand:
+    args = _get_command_args(command)
+    hints = typing.get_type_hints(command.fn)
+    return CompiledCommand(
+        path=path,
+        command=command,
+        converters=types.MappingProxyType(
+            {name: _get_option_converter(hints[name]) for name in args}
+        ),
+        required=tuple(name for name, opt in args.items() if opt.required),
+        autocomplete=types.MappingProxyType(
+            {
+                name: hints[name]
+                for name in args
+                if isinstance(hints[name], Autocomplete)
+            }
+        ),
+    )
+
+
+def _compile_group(path: str, group: Group) -> Dict[str, CompiledCommand]:
+    result = {}
+    for command in group.commands.values():
+        command_path = f"{path} {command.name}"
+        result[command_path] = _compile_command(command_path, command)
+
+    for subgroup in group.children.values():
+        result.update(_compile_group(f"{path} {subgroup.name}", subgroup))
+    return result
+
+
+def build_dispatch_table(
+    commands: Dict[str, DashedCommand], groups: Dict[str, Group]
+) -> Mapping[str, CompiledCommand]:
+    table = {}
+    for command in commands.values():
+        table[command.name] = _compile_command(command.name, command)
+
+    for group in groups.values():
+        table.update(_compile_group(group.name, group))
+
+    return types.MappingProxyType(table)
+
+
+_SUB_COMMAND_TYPES = (
+    ApplicationCommandOptionType.SUB_COMMAND,
+    ApplicationCommandOptionType.SUB_COMMAND_GROUP,
+)
+
+
+def resolve_command_path(
+    command_data: Dict[str, Any],
+) -> Tuple[str, List[Dict[str, Any]]]:
+    path = command_data["name"]
+    options = command_data.get("options", [])
+    while options and options[0]["type"] in _SUB_COMMAND_TYPES:
+        path = f"{path} {options[0]['name']}"
+        options = options[0].get("options", [])
+    return path, options
 
 
 @dataclasses.dataclass
 class DashedContext:
     client: DiscordAPIClient
-    application_key: str
+    # The application's public key, as hex, bytes or a nacl VerifyKey. Used to
+    # build a verifier with the default settings when none is passed.
+    application_key: Optional[Any]
     commands: Dict[str, DashedCommand]
     groups: Dict[str, Group]
+    components: Dict[str, DashedComponent] = dataclasses.field(default_factory=dict)
+    scheduler: Scheduler = dataclasses.field(default_factory=Scheduler)
+    pools: HandlerPools = dataclasses.field(default_factory=HandlerPools)
+    hooks: Hooks = dataclasses.field(default_factory=Hooks)
+    # Responses to recently seen interaction ids, see _handle_interaction
+    recent_interactions: Optional[AsyncTTLCache] = None
+    response_deadline: Optional[float] = 2.5
+    modules: List[DashedModule] = dataclasses.field(default_factory=list)
+    verifier: Optional[SignatureVerifier] = None
+    dispatch: Mapping[str, CompiledCommand] = dataclasses.field(init=False)
+    router: ComponentRouter = dataclasses.field(init=False)
+
+    def __post_init__(self):
+        if self.verifier is None and self.application_key is not None:
+            key = self.application_key
+            self.verifier = SignatureVerifier(
+                bytes.fromhex(key) if isinstance(key, str) else bytes(key)
+            )
+        self.dispatch = build_dispatch_table(self.commands, self.groups)
+        self.router = ComponentRouter(self.components.values())
+
+    def swap(
+        self,
+        commands: Dict[str, DashedCommand],
+        groups: Dict[str, Group],
+        components: Dict[str, DashedComponent],
+    ):
+        # Build everything before touching the context. The assignments below
+        # happen without yielding to the event loop, so requests only ever see
+        # the complete old or complete new tables, and requests that already
+        # looked up their handler finish on the old one.
+        dispatch = build_dispatch_table(commands, groups)
+        router = ComponentRouter(components.values())
+
+        self.commands = commands
+        self.groups = groups
+        self.components = components
+        self.dispatch = dispatch
+        self.router = router
 
     async def register_commands(self, application_id):
         for command in self.commands.values():
             await self.client.create_global_application_command(
                 application_id,
-                dataclasses.asdict(_get_application_command_description(command)),
+                encode(_get_application_command_description(command)),
             )
 
     async def register_groups(self, application_id):
         for group in self.groups.values():
             await self.client.create_global_application_command(
                 application_id,
-                dataclasses.asdict(_get_application_group_description(group)),
+                encode(_get_application_group_description(group)),
             )
 
+    def get_application_command_schema(self) -> List[Dict[str, Any]]:
+        return [
+            encode(_get_application_command_description(command))
+            for command in self.commands.values()
+        ] + [
+            encode(_get_application_group_description(group))
+            for group in self.groups.values()
+        ]
+
+    async def sync_commands(
+        self,
+        application_id,
+        strategy: str = "bulk",
+        delete_unknown: bool = False,
+        cache: Optional[SchemaCache] = None,
+        guild_id: Optional[str] = None,
+    ) -> SyncResult:
+        return await sync_commands(
+            self.client,
+            application_id,
+            self.get_application_command_schema(),
+            strategy=strategy,
+            delete_unknown=delete_unknown,
+            cache=cache,
+            guild_id=guild_id,
+        )
 
-async def load_from_file(path: pathlib.Path) -> DashedModule:
-    import importlib.machinery
+    async def sync_guild_commands(
+        self,
+        application_id,
+        guild_ids: List[str],
+        strategy: str = "bulk",
+        delete_unknown: bool = False,
+        cache: Optional[SchemaCache] = None,
+        concurrency: int = 8,
+        on_result: Optional[Callable[[GuildSyncResult], None]] = None,
+    ) -> List[GuildSyncResult]:
+        return await sync_guild_commands(
+            self.client,
+            application_id,
+            guild_ids,
+            self.get_application_command_schema(),
+            strategy=strategy,
+            delete_unknown=delete_unknown,
+            cache=cache,
+            concurrency=concurrency,
+            on_result=on_result,
+        )
 
-    module = importlib.machinery.SourceFileLoader(
-        f"dashed.runtime.module.{path.stem}", str(path)
-    ).load_module()
 
-    if hasattr(module, "initialize"):
-        await module.initialize()
+def _flush_registered_buffers() -> Tuple[List, List, List]:
+    return (
+        _flush_registered_commands_buffer(),
+        _flush_registered_groups_buffer(),
+        _flush_registered_components_buffer(),
+    )
+
 
+def _exec_module_in_thread(loop: asyncio.AbstractEventLoop, spec, module):
+    # Module level code may look up the event loop (asyncio primitives did
+    # before Python 3.10), so it gets the server's like it would on the loop.
+    asyncio.set_event_loop(loop)
+    try:
+        spec.loader.exec_module(module)
+    finally:
+        asyncio.set_event_loop(None)
+
+
+async def load_from_file(
+    path: pathlib.Path,
+    initialize_timeout: Optional[float] = None,
+    import_in_thread: bool = False,
+) -> DashedModule:
+    import importlib.util
+
+    # Every load executes a fresh module object, so reloading a file never
+    # mutates the module (and handlers) that in-flight requests are using.
+    name = f"dashed.runtime.module.{path.stem}"
+    spec = importlib.util.spec_from_file_location(name, str(path))
+    module = importlib.util.module_from_spec(spec)
+
+    previous = sys.modules.get(name)
+    sys.modules[name] = module
+    token = _registration_buffers.set(_RegistrationBuffers())
+    try:
+        started = time.perf_counter()
+        if import_in_thread:
+            # Keeps the loop serving requests while a module is imported
+            # after startup. The copied context carries the registration
+            # buffers into the thread.
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(
+                None,
+                contextvars.copy_context().run,
+                _exec_module_in_thread,
+                loop,
+                spec,
+                module,
+            )
+        else:
+            spec.loader.exec_module(module)
+        imported = time.perf_counter()
+
+        if hasattr(module, "initialize"):
+            try:
+                await asyncio.wait_for(module.initialize(), initialize_timeout)
+            except asyncio.TimeoutError:
+                raise TimeoutError(
+                    f"initialize() of {path} did not finish within "
+                    f"{initialize_timeout}s"
+                )
+        initialized = time.perf_counter()
+
+        commands, groups, components = _flush_registered_buffers()
+    except BaseException:
+        if previous is None:
+            sys.modules.pop(name, None)
+        else:
+            sys.modules[name] = previous
+        raise
+    finally:
+        _registration_buffers.reset(token)
+
+    mtime = path.stat().st_mtime
+    remember_module(str(path), mtime, module)
     return DashedModule(
         name=path.stem,
-        commands=_flush_registered_commands_buffer(),
-        groups=_flush_registered_groups_buffer(),
+        commands=commands,
+        groups=groups,
+        components=components,
+        path=path,
+        mtime=mtime,
+        import_seconds=imported - started,
+        initialize_seconds=initialized - imported,
     )
 
 
+async def load_modules(
+    paths: List[pathlib.Path], initialize_timeout: Optional[float] = None
+) -> List[DashedModule]:
+    # Modules are executed one at a time (importing is synchronous), but
+    # their initialize() hooks all run concurrently.
+    return list(
+        await asyncio.gather(
+            *(load_from_file(path, initialize_timeout) for path in paths)
+        )
+    )
+
+
+def collect_modules(
+    modules: List[DashedModule],
+) -> Tuple[Dict[str, DashedCommand], Dict[str, Group], Dict[str, DashedComponent]]:
+    commands = {}
+    groups = {}
+    components = {}
+    for module in modules:
+        for command in module.commands:
+            commands[command.name] = command
+        for group in module.groups:
+            groups[group.name] = group
+        for component in module.components:
+            components[component.pattern] = component
+    return commands, groups, components
+
+
 def _get_options_for_group(group: Group) -> List[ApplicationCommandOption]:
     options = []
 
@@ -199,7 +752,7 @@ def _get_option_type_and_choices(
         return ApplicationCommandOptionType.INTEGER, None
     elif type_ is bool:
         return ApplicationCommandOptionType.BOOLEAN, None
-    elif type_ is User:
+    elif type_ is User or type_ is Member:
         return ApplicationCommandOptionType.USER, None
     elif type_ is Channel:
         return ApplicationCommandOptionType.CHANNEL, None
@@ -211,6 +764,8 @@ def _get_option_type_and_choices(
         inner, choices = _get_option_type_and_choices(type_.inner_type)
         assert choices is None, "cannot have nested TypeWithOptions"
         return inner, [{"name": k, "value": v} for k, v in type_.choices.items()]
+    elif isinstance(type_, Autocomplete):
+        return _get_option_type_and_choices(type_.inner_type)
     else:
         raise Exception(
             f"Could not determine application command option type for {type_}"
@@ -222,7 +777,7 @@ def _get_command_args(command: DashedCommand) -> Dict[str, ApplicationCommandOpt
     type_hint = typing.get_type_hints(command.fn)
 
     assert list(type_hint.keys())[0] == "ctx"
-    args = {k for k in list(type_hint.keys())[1:]}
+    args = [k for k in list(type_hint.keys())[1:] if k != "return"]
     arg_types = {k: type_hint[k] for k in args}
 
     opts = OrderedDict()
@@ -236,5 +791,6 @@ def _get_command_args(command: DashedCommand) -> Dict[str, ApplicationCommandOpt
             description=arg,
             required=required,
             choices=choices,
+            autocomplete=isinstance(arg_types[arg], Autocomplete),
         )
     return opts
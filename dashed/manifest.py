@@ -0,0 +1,389 @@
+import asyncio
+import inspect
+import json
+import os
+import pathlib
+import site
+import sys
+import time
+import typing
+from typing import Any, Callable, Dict, List, Optional
+
+from dashed.discord import Channel, Member, Mentionable, Role, User
+from dashed.executors import _RUNTIME_MODULE_PREFIX
+from dashed.loader import (
+    Autocomplete,
+    DashedCommand,
+    DashedComponent,
+    DashedModule,
+    Group,
+    TypeWithChoices,
+    _RegistrationBuffers,
+    _registration_buffers,
+    load_from_file,
+)
+
+MANIFEST_VERSION = 5
+DEFAULT_MANIFEST_PATH = pathlib.Path(".dashed-manifest.json")
+
+_OPTION_TYPES = {
+    type_.__name__: type_
+    for type_ in (str, int, float, bool, User, Member, Channel, Role, Mentionable)
+}
+
+
+def _context_types() -> Dict[str, type]:
+    from dashed.interaction import (
+        ComponentContext,
+        DeferredComponentContext,
+        DeferredInteractionContext,
+        InteractionContext,
+    )
+
+    return {
+        type_.__name__: type_
+        for type_ in (
+            InteractionContext,
+            DeferredInteractionContext,
+            ComponentContext,
+            DeferredComponentContext,
+        )
+    }
+
+
+def _describe_type(type_: Any) -> Dict[str, Any]:
+    if isinstance(type_, TypeWithChoices):
+        return {"type": type_.inner_type.__name__, "choices": type_.choices}
+    elif isinstance(type_, Autocomplete):
+        cache = type_.cache
+        return {
+            "type": type_.inner_type.__name__,
+            "autocomplete": {
+                "name": type_.fn.__name__,
+                "cache": cache is not None,
+                "ttl": cache.ttl if cache is not None else None,
+                "max_size": cache.max_size if cache is not None else None,
+            },
+        }
+
+    assert _OPTION_TYPES.get(type_.__name__) is type_, f"unsupported type {type_}"
+    return {"type": type_.__name__}
+
+
+def _describe_fn(fn) -> Dict[str, Any]:
+    hints = typing.get_type_hints(fn)
+    signature = inspect.signature(fn)
+    return {
+        "name": fn.__name__,
+        "context": hints["ctx"].__name__,
+        "streaming": inspect.isasyncgenfunction(fn),
+        "args": [
+            dict(
+                _describe_type(hints[name]),
+                name=name,
+                required=signature.parameters[name].default is inspect.Parameter.empty,
+            )
+            for name in list(hints)[1:]
+            if name != "return"
+        ],
+    }
+
+
+def _describe_command(command: DashedCommand) -> Dict[str, Any]:
+    return {
+        "name": command.name,
+        "description": command.description,
+        "timeout": command.timeout,
+        "priority": command.priority,
+        "executor": command.executor,
+        "ephemeral": command.ephemeral,
+        "fn": _describe_fn(command.fn),
+    }
+
+
+def _describe_group(group: Group) -> Dict[str, Any]:
+    return {
+        "name": group.name,
+        "description": group.description,
+        "commands": [_describe_command(c) for c in group.commands.values()],
+        "children": [_describe_group(g) for g in group.children.values()],
+    }
+
+
+def _group_commands(group: Group) -> List[DashedCommand]:
+    commands = list(group.commands.values())
+    for child in group.children.values():
+        commands.extend(_group_commands(child))
+    return commands
+
+
+def _describe_module(module: DashedModule) -> Dict[str, Any]:
+    commands = list(module.commands)
+    for group in module.groups:
+        commands.extend(_group_commands(group))
+
+    return {
+        "mtime": module.mtime,
+        # Response caches (and their backends) only exist in the module itself
+        "eager": any(command.cache is not None for command in commands),
+        "commands": [_describe_command(c) for c in module.commands],
+        "groups": [_describe_group(g) for g in module.groups],
+        "components": [
+            {
+                "pattern": c.pattern,
+                "timeout": c.timeout,
+                "priority": c.priority,
+                "executor": c.executor,
+                "fn": _describe_fn(c.fn),
+            }
+            for c in module.components
+        ],
+    }
+
+
+def _source_mtimes(previous: Dict[str, float]) -> Dict[str, float]:
+    # Command modules can take their commands (or options) from any helper
+    # they import, so every imported file outside of the Python installation
+    # and its packages is tracked. Files imported by the lazy modules of an
+    # earlier run aren't imported now, and are carried over.
+    installed = tuple(
+        {sys.prefix, sys.base_prefix, sys.exec_prefix, site.getusersitepackages()}
+    )
+    paths = set(previous)
+    for name, module in list(sys.modules.items()):
+        source = getattr(module, "__file__", None)
+        if (
+            source is not None
+            and not name.startswith(_RUNTIME_MODULE_PREFIX)
+            and not source.startswith(installed)
+        ):
+            paths.add(source)
+
+    sources = {}
+    for source in paths:
+        try:
+            sources[source] = os.stat(source).st_mtime
+        except OSError:
+            continue
+    return sources
+
+
+def _sources_changed(sources: Dict[str, float]) -> bool:
+    for source, mtime in sources.items():
+        try:
+            if os.stat(source).st_mtime != mtime:
+                return True
+        except OSError:
+            return True
+    return False
+
+
+def _read_manifest(path: pathlib.Path) -> Dict[str, Any]:
+    try:
+        manifest = json.loads(path.read_text())
+    except (OSError, ValueError):
+        return {}
+    return manifest if manifest.get("version") == MANIFEST_VERSION else {}
+
+
+def write_manifest(path: pathlib.Path, modules: List[DashedModule]):
+    path.write_text(
+        json.dumps(
+            {
+                "version": MANIFEST_VERSION,
+                "sources": _source_mtimes(_read_manifest(path).get("sources", {})),
+                "modules": {
+                    str(module.path.resolve()): _describe_module(module)
+                    for module in modules
+                },
+            },
+            indent=2,
+        )
+    )
+
+
+class _LazyModule:
+    def __init__(self, path: pathlib.Path, initialize_timeout: Optional[float]):
+        self.path = path
+        self.initialize_timeout = initialize_timeout
+        self._module: Optional[DashedModule] = None
+        self._lock = asyncio.Lock()
+
+    async def load(self) -> DashedModule:
+        if self._module is None:
+            async with self._lock:
+                if self._module is None:
+                    started = time.perf_counter()
+                    self._module = await load_from_file(
+                        self.path, self.initialize_timeout, import_in_thread=True
+                    )
+                    print(
+                        f"Loaded {self.path} lazily in "
+                        f"{time.perf_counter() - started:.2f}s"
+                    )
+        return self._module
+
+    async def command(self, name: str):
+        module = await self.load()
+        return next(c.fn for c in module.commands if c.name == name)
+
+    async def group_command(self, path: List[str]):
+        module = await self.load()
+        group = next(g for g in module.groups if g.name == path[0])
+        for name in path[1:-1]:
+            group = group.children[name]
+        return group.commands[path[-1]].fn
+
+    async def component(self, pattern: str):
+        module = await self.load()
+        return next(c.fn for c in module.components if c.pattern == pattern)
+
+
+def _lazy_autocomplete(resolve, option: str, name: str):
+    async def autocomplete(ctx, value):
+        fn = await resolve()
+        return await typing.get_type_hints(fn)[option].fn(ctx, value)
+
+    autocomplete.__name__ = name
+    return autocomplete
+
+
+def _build_type(description: Dict[str, Any], resolve) -> Any:
+    type_ = _OPTION_TYPES[description["type"]]
+    if "choices" in description:
+        return TypeWithChoices(type_, description["choices"])
+    elif "autocomplete" in description:
+        options = description["autocomplete"]
+        return Autocomplete(
+            type_,
+            _lazy_autocomplete(resolve, description["name"], options["name"]),
+            cache=options["cache"],
+            ttl=options["ttl"],
+            max_size=options["max_size"] or 0,
+        )
+    return type_
+
+
+def _build_fn(description: Dict[str, Any], resolve: Callable):
+    # A stand-in with the same signature and annotations as the real handler,
+    # so the schema and dispatch table can be built without importing it.
+    if description["streaming"]:
+
+        async def handler(ctx, **kwargs):
+            fn = await resolve()
+            async for update in fn(ctx, **kwargs):
+                yield update
+
+    else:
+
+        async def handler(ctx, **kwargs):
+            fn = await resolve()
+            return await fn(ctx, **kwargs)
+
+    annotations = {"ctx": _context_types()[description["context"]]}
+    parameters = [inspect.Parameter("ctx", inspect.Parameter.POSITIONAL_OR_KEYWORD)]
+    for arg in description["args"]:
+        annotations[arg["name"]] = _build_type(arg, resolve)
+        parameters.append(
+            inspect.Parameter(
+                arg["name"],
+                inspect.Parameter.KEYWORD_ONLY,
+                default=inspect.Parameter.empty if arg["required"] else None,
+            )
+        )
+
+    handler.__name__ = description["name"]
+    handler.__annotations__ = annotations
+    handler.__signature__ = inspect.Signature(parameters)
+    # Handlers that run in a pool are resolved first, the stub itself can't
+    # cross into a thread or process
+    handler.resolve = resolve
+    return handler
+
+
+def _build_command(description: Dict[str, Any], resolve) -> DashedCommand:
+    return DashedCommand(
+        name=description["name"],
+        description=description["description"],
+        fn=_build_fn(description["fn"], resolve),
+        timeout=description["timeout"],
+        priority=description["priority"],
+        executor=description["executor"],
+        ephemeral=description["ephemeral"],
+    )
+
+
+def _build_group(
+    description: Dict[str, Any], lazy: _LazyModule, path: List[str]
+) -> Group:
+    path = path + [description["name"]]
+    group = Group(name=description["name"], description=description["description"])
+    for command in description["commands"]:
+        group.commands[command["name"]] = _build_command(
+            command,
+            lambda name=command["name"]: lazy.group_command(path + [name]),
+        )
+    for child in description["children"]:
+        group.children[child["name"]] = _build_group(child, lazy, path)
+    return group
+
+
+def _build_module(
+    path: pathlib.Path, description: Dict[str, Any], lazy: _LazyModule
+) -> DashedModule:
+    # Building groups registers them like a module import would, keep that
+    # out of whatever is being loaded right now.
+    token = _registration_buffers.set(_RegistrationBuffers())
+    try:
+        return DashedModule(
+            name=path.stem,
+            commands=[
+                _build_command(c, lambda name=c["name"]: lazy.command(name))
+                for c in description["commands"]
+            ],
+            groups=[_build_group(g, lazy, []) for g in description["groups"]],
+            components=[
+                DashedComponent(
+                    pattern=c["pattern"],
+                    fn=_build_fn(
+                        c["fn"], lambda pattern=c["pattern"]: lazy.component(pattern)
+                    ),
+                    timeout=c["timeout"],
+                    priority=c["priority"],
+                    executor=c["executor"],
+                )
+                for c in description["components"]
+            ],
+            path=path,
+            mtime=description["mtime"],
+            load=lazy.load,
+        )
+    finally:
+        _registration_buffers.reset(token)
+
+
+def load_manifest(
+    path: pathlib.Path,
+    module_paths: List[pathlib.Path],
+    initialize_timeout: Optional[float] = None,
+) -> Dict[pathlib.Path, DashedModule]:
+    # Returns lazily loaded modules for every path whose manifest entry is
+    # still current, anything missing or changed has to be imported.
+    manifest = _read_manifest(path)
+    if not manifest or _sources_changed(manifest["sources"]):
+        return {}
+
+    modules = {}
+    for module_path in module_paths:
+        description = manifest["modules"].get(str(module_path.resolve()))
+        try:
+            mtime = module_path.stat().st_mtime
+        except OSError:
+            continue
+        if description is None or description["mtime"] != mtime or description["eager"]:
+            continue
+
+        modules[module_path] = _build_module(
+            module_path, description, _LazyModule(module_path, initialize_timeout)
+        )
+    return modules
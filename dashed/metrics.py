@@ -0,0 +1,274 @@
+import abc
+import bisect
+import contextlib
+import time
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+DEFAULT_BUCKETS = (
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.0,
+    2.5,
+    3.0,
+    5.0,
+    10.0,
+)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value))
+
+
+class _Metric(abc.ABC):
+    type = ""
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels[name]) for name in self.labels)
+
+    @abc.abstractmethod
+    def _samples(self) -> List[str]:
+        pass
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+        lines.extend(self._samples())
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        super().__init__(name, help, labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def get(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def _samples(self) -> List[str]:
+        return [
+            f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}"
+            for key, value in self._values.items()
+        ]
+
+
+class Gauge(_Metric):
+    type = "gauge"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        super().__init__(name, help, labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._functions: Dict[Tuple[str, ...], Callable[[], float]] = {}
+
+    def set(self, value: float, **labels):
+        self._values[self._key(labels)] = value
+
+    def set_function(self, fn: Callable[[], float], **labels):
+        self._functions[self._key(labels)] = fn
+
+    def _samples(self) -> List[str]:
+        values = dict(self._values)
+        for key, fn in self._functions.items():
+            values[key] = fn()
+        return [
+            f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}"
+            for key, value in values.items()
+        ]
+
+
+class _HistogramValue:
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self, size: int):
+        self.counts = [0] * size
+        self.sum = 0.0
+        self.count = 0
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labels: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        self._values: Dict[Tuple[str, ...], _HistogramValue] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        histogram = self._values.get(key)
+        if histogram is None:
+            histogram = self._values[key] = _HistogramValue(len(self.buckets))
+        histogram.counts[bisect.bisect_left(self.buckets, value)] += 1
+        histogram.sum += value
+        histogram.count += 1
+
+    @contextlib.contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def _samples(self) -> List[str]:
+        lines = []
+        for key, histogram in self._values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets, histogram.counts):
+                cumulative += count
+                labels = _format_labels(
+                    self.labels, key, f'le="{_format_value(bound)}"'
+                )
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labels, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(histogram.sum)}")
+            lines.append(f"{self.name}_count{labels} {histogram.count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        assert metric.name not in self._metrics, f"duplicate metric {metric.name}"
+        self._metrics[metric.name] = metric
+        return metric
+
+    def get(self, name: str) -> Optional[_Metric]:
+        return self._metrics.get(name)
+
+    def render(self) -> str:
+        return "\n".join(metric.render() for metric in self._metrics.values()) + "\n"
+
+
+REGISTRY = Registry()
+
+INTERACTIONS = REGISTRY.register(
+    Counter("dashed_interactions_total", "Interactions received", ["type"])
+)
+COMMAND_LATENCY = REGISTRY.register(
+    Histogram("dashed_command_latency_seconds", "Command handler latency", ["command"])
+)
+STAGE_LATENCY = REGISTRY.register(
+    Histogram(
+        "dashed_stage_latency_seconds",
+        "Time spent in each stage of handling an interaction",
+        ["stage"],
+    )
+)
+INVALID_INTERACTIONS = REGISTRY.register(
+    Counter(
+        "dashed_invalid_interactions_total",
+        "Interactions rejected with a 400 because nothing handles them",
+        ["reason"],
+    )
+)
+SCHEDULER_QUEUE_DEPTH = REGISTRY.register(
+    Gauge("dashed_scheduler_queue_depth", "Deferred handlers waiting to run")
+)
+SCHEDULER_IN_FLIGHT = REGISTRY.register(
+    Gauge("dashed_scheduler_in_flight", "Deferred handlers currently running")
+)
+API_LATENCY = REGISTRY.register(
+    Histogram(
+        "dashed_api_request_latency_seconds",
+        "Discord API request latency",
+        ["route"],
+    )
+)
+API_ERRORS = REGISTRY.register(
+    Counter(
+        "dashed_api_errors_total",
+        "Discord API requests that failed, by status code",
+        ["route", "status"],
+    )
+)
+API_RATE_LIMITED = REGISTRY.register(
+    Counter(
+        "dashed_api_rate_limited_total",
+        "Discord API requests answered with a 429",
+        ["route"],
+    )
+)
+API_RATE_LIMIT_SLEEP = REGISTRY.register(
+    Counter(
+        "dashed_api_rate_limit_sleep_seconds_total",
+        "Time spent waiting on Discord API rate limits",
+        ["route"],
+    )
+)
+CACHE_REQUESTS = REGISTRY.register(
+    Counter(
+        "dashed_cache_requests_total",
+        "Cache lookups by result (hit, miss or coalesced)",
+        ["cache", "result"],
+    )
+)
+DEADLINE_DEFERRED = REGISTRY.register(
+    Counter(
+        "dashed_deadline_deferred_total",
+        "Commands deferred because they missed the response deadline",
+        ["command"],
+    )
+)
+EXECUTOR_WORKERS = REGISTRY.register(
+    Gauge("dashed_executor_workers", "Workers in each handler pool", ["executor"])
+)
+EXECUTOR_BUSY = REGISTRY.register(
+    Gauge(
+        "dashed_executor_busy_workers",
+        "Handler pool workers currently running a handler",
+        ["executor"],
+    )
+)
+EXECUTOR_QUEUED = REGISTRY.register(
+    Gauge(
+        "dashed_executor_queued",
+        "Handlers waiting for a free handler pool worker",
+        ["executor"],
+    )
+)
+EXECUTOR_QUEUE_WAIT = REGISTRY.register(
+    Histogram(
+        "dashed_executor_queue_wait_seconds",
+        "Time handlers waited for a handler pool worker",
+        ["executor"],
+    )
+)
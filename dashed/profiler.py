@@ -0,0 +1,137 @@
+import cProfile
+import dataclasses
+import pathlib
+import sys
+import threading
+import time
+import traceback
+from typing import Dict, List, Optional
+
+from dashed.hooks import Hooks, StageEvent
+
+PROFILER_MODES = ("stack", "profile")
+
+
+@dataclasses.dataclass
+class _Trace:
+    started: float
+    events: List[StageEvent] = dataclasses.field(default_factory=list)
+    stacks: List[str] = dataclasses.field(default_factory=list)
+    profile: Optional[cProfile.Profile] = None
+
+
+class SlowRequestProfiler:
+    # Writes a report for every interaction that takes longer than
+    # `threshold` seconds: the time spent in each stage plus, depending on the
+    # mode, snapshots of the event loop thread's stack taken while the request
+    # was over the threshold ("stack"), or a cProfile of the request
+    # ("profile", one request at a time, and including whatever else the
+    # event loop ran meanwhile).
+    def __init__(
+        self,
+        directory: pathlib.Path,
+        threshold: float = 1.0,
+        mode: str = "stack",
+        interval: Optional[float] = None,
+    ):
+        assert mode in PROFILER_MODES, f"unknown profiler mode {mode!r}"
+        self.directory = directory
+        self.threshold = threshold
+        self.mode = mode
+        self.interval = interval or threshold / 4
+        self.reports = 0
+
+        self._traces: Dict[str, _Trace] = {}
+        self._lock = threading.Lock()
+        self._profiling = False
+        self._thread_id: Optional[int] = None
+        self._stopped = threading.Event()
+
+    def install(self, hooks: Hooks):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        hooks.before(self._before)
+        hooks.after(self._after)
+
+        # Sampled from another thread, a blocked event loop can't sample itself
+        if self.mode == "stack":
+            self._thread_id = threading.get_ident()
+            threading.Thread(
+                target=self._sample, name="dashed-profiler", daemon=True
+            ).start()
+
+    def stop(self):
+        self._stopped.set()
+
+    def _before(self, event: StageEvent):
+        if event.stage != "request":
+            return
+
+        trace = _Trace(event.started)
+        if self.mode == "profile" and not self._profiling:
+            self._profiling = True
+            trace.profile = cProfile.Profile()
+            trace.profile.enable()
+        with self._lock:
+            self._traces[event.trace_id] = trace
+
+    def _after(self, event: StageEvent):
+        trace = self._traces.get(event.trace_id)
+        if trace is None:
+            return
+        elif event.stage != "request":
+            trace.events.append(event)
+            return
+
+        with self._lock:
+            del self._traces[event.trace_id]
+        if trace.profile is not None:
+            trace.profile.disable()
+            self._profiling = False
+
+        if event.duration >= self.threshold:
+            self._write(event, trace)
+
+    def _sample(self):
+        while not self._stopped.wait(self.interval):
+            now = time.monotonic()
+            with self._lock:
+                slow = [
+                    trace
+                    for trace in self._traces.values()
+                    if now - trace.started >= self.threshold
+                ]
+            if not slow:
+                continue
+
+            frame = sys._current_frames().get(self._thread_id)
+            if frame is None:
+                continue
+            stack = "".join(traceback.format_stack(frame))
+            for trace in slow:
+                trace.stacks.append(f"after {now - trace.started:.3f}s:\n{stack}")
+
+    def _write(self, event: StageEvent, trace: _Trace):
+        name = next(
+            (e.name for e in trace.events if e.stage == "handler"), "interaction"
+        )
+        path = self.directory / (
+            f"{time.strftime('%Y%m%d-%H%M%S')}-{event.trace_id}-"
+            f"{name.replace(' ', '-')}"
+        )
+
+        lines = [f"{name} took {event.duration:.3f}s (trace {event.trace_id})", ""]
+        for stage in trace.events:
+            lines.append(
+                f"{stage.started - trace.started:8.3f}s "
+                f"{stage.duration:8.3f}s  {stage.stage}"
+                + (f" {stage.name}" if stage.name else "")
+                + (f" ({stage.error!r})" if stage.error else "")
+            )
+        for stack in trace.stacks:
+            lines.extend(["", stack])
+        path.with_suffix(".txt").write_text("\n".join(lines) + "\n")
+
+        if trace.profile is not None:
+            trace.profile.dump_stats(path.with_suffix(".prof"))
+        self.reports += 1
+        print(f"Request {event.trace_id} took {event.duration:.3f}s, wrote {path}")
@@ -0,0 +1,245 @@
+import asyncio
+import dataclasses
+import time
+from typing import Dict, Mapping, Optional, Tuple
+
+# Discord scopes rate limit buckets by these "major" path parameters in
+# addition to the route itself.
+_MAJOR_PARAMETERS = ("guild_id", "channel_id", "webhook_id", "interaction_token")
+
+# Interaction webhooks are not subject to the global rate limit
+_GLOBAL_EXEMPT_PREFIX = "/webhooks/{webhook_id}/{interaction_token}"
+
+
+class Route:
+    def __init__(self, method: str, path: str, **params):
+        self.method = method
+        self.template = path
+        self.path = path.format(**params)
+        self.key = f"{method} {path}"
+        self.global_limited = not path.startswith(_GLOBAL_EXEMPT_PREFIX)
+        self.major = ":".join(
+            str(params[name]) for name in _MAJOR_PARAMETERS if name in params
+        )
+
+    def __repr__(self):
+        return f"<Route {self.method} {self.path}>"
+
+
+@dataclasses.dataclass
+class RateLimiterStats:
+    requests: int = 0
+    waits: int = 0
+    wait_seconds: float = 0.0
+    max_wait_seconds: float = 0.0
+    rate_limited: int = 0
+    global_rate_limited: int = 0
+    wait_seconds_by_route: Dict[str, float] = dataclasses.field(default_factory=dict)
+
+    def record_wait(self, route: Route, seconds: float):
+        self.waits += 1
+        self.wait_seconds += seconds
+        self.max_wait_seconds = max(self.max_wait_seconds, seconds)
+        self.wait_seconds_by_route[route.key] = (
+            self.wait_seconds_by_route.get(route.key, 0.0) + seconds
+        )
+
+
+class Bucket:
+    def __init__(self):
+        self.limit: Optional[int] = None
+        self.remaining: Optional[int] = None
+        self.reset_at = 0.0
+        self._lock = asyncio.Lock()
+        self._probing = False
+        self._learned = asyncio.Event()
+
+    @property
+    def idle(self) -> bool:
+        return not self._lock.locked() and not self._probing
+
+    def delay(self, now: float) -> float:
+        if self.remaining is None or self.remaining > 0 or now >= self.reset_at:
+            return 0.0
+        return self.reset_at - now
+
+    async def wait(self):
+        # Waiters queue on the bucket lock so they are released in order and
+        # never stampede a bucket that has just reset.
+        async with self._lock:
+            while True:
+                if self.limit is None:
+                    if not self._probing:
+                        self._probing = True
+                        return
+                    await self._learned.wait()
+                    continue
+
+                now = time.monotonic()
+                if now >= self.reset_at and self.remaining == 0:
+                    self.remaining = self.limit
+
+                delay = self.delay(now)
+                if delay <= 0:
+                    if self.remaining is not None:
+                        self.remaining -= 1
+                    return
+
+                await asyncio.sleep(delay)
+
+    def update(self, headers: Mapping[str, str]):
+        if "X-RateLimit-Limit" in headers:
+            limit = int(headers["X-RateLimit-Limit"])
+            remaining = int(headers["X-RateLimit-Remaining"])
+            reset_at = time.monotonic() + float(headers["X-RateLimit-Reset-After"])
+
+            if self.limit is None or reset_at > self.reset_at + 0.5:
+                self.remaining = remaining
+            else:
+                self.remaining = min(self.remaining or 0, remaining)
+            self.limit = limit
+            self.reset_at = reset_at
+        self.release()
+
+    def exhaust(self, retry_after: float):
+        self.remaining = 0
+        self.reset_at = max(self.reset_at, time.monotonic() + retry_after)
+        if self.limit is None:
+            self.limit = 1
+
+    def release(self):
+        if self._probing:
+            self._probing = False
+            self._learned.set()
+            self._learned.clear()
+
+
+class _Ticket:
+    def __init__(self, limiter: "RateLimiter", route: Route):
+        self.limiter = limiter
+        self.route = route
+        self.bucket: Optional[Bucket] = None
+        self.waited = 0.0
+
+    async def __aenter__(self):
+        self.bucket, self.waited = await self.limiter._acquire(self.route)
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.bucket.release()
+
+    def update(self, headers: Mapping[str, str]):
+        self.limiter._update(self.route, self.bucket, headers)
+
+    def rate_limited(self, headers: Mapping[str, str], body: Dict) -> float:
+        return self.limiter._rate_limited(self.route, self.bucket, headers, body)
+
+
+class RateLimiter:
+    def __init__(
+        self,
+        global_limit: Optional[int] = 50,
+        max_buckets: int = 10000,
+    ):
+        self.global_limit = global_limit
+        self.max_buckets = max_buckets
+        self.stats = RateLimiterStats()
+
+        self._bucket_hashes: Dict[str, str] = {}
+        self._buckets: Dict[Tuple[str, str], Bucket] = {}
+        self._global_reset_at = 0.0
+        self._global_window = 0.0
+        self._global_count = 0
+
+    def acquire(self, route: Route) -> _Ticket:
+        return _Ticket(self, route)
+
+    def delay(self, route: Route) -> float:
+        # How long a request on this route would currently have to wait for
+        # its bucket, without reserving anything.
+        key = (self._bucket_hashes.get(route.key, route.key), route.major)
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            return 0.0
+        return bucket.delay(time.monotonic())
+
+    def _bucket(self, route: Route) -> Bucket:
+        key = (self._bucket_hashes.get(route.key, route.key), route.major)
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            if len(self._buckets) >= self.max_buckets:
+                self._prune()
+            bucket = self._buckets[key] = Bucket()
+        return bucket
+
+    def _prune(self):
+        now = time.monotonic()
+        for key, bucket in list(self._buckets.items()):
+            if bucket.idle and bucket.reset_at <= now:
+                del self._buckets[key]
+
+    async def _wait_global(self):
+        while True:
+            now = time.monotonic()
+            if now < self._global_reset_at:
+                delay = self._global_reset_at - now
+            elif self.global_limit is not None:
+                if now >= self._global_window:
+                    self._global_window = now + 1.0
+                    self._global_count = 0
+                if self._global_count < self.global_limit:
+                    self._global_count += 1
+                    return
+                delay = self._global_window - now
+            else:
+                return
+
+            await asyncio.sleep(delay)
+
+    async def _acquire(self, route: Route) -> Tuple[Bucket, float]:
+        self.stats.requests += 1
+        bucket = self._bucket(route)
+
+        started = time.monotonic()
+        await bucket.wait()
+        if route.global_limited:
+            try:
+                await self._wait_global()
+            except BaseException:
+                # The ticket never enters, so a bucket this request was
+                # probing would otherwise block its route for good.
+                bucket.release()
+                raise
+        waited = time.monotonic() - started
+        if waited > 0.001:
+            self.stats.record_wait(route, waited)
+        return bucket, waited
+
+    def _update(self, route: Route, bucket: Bucket, headers: Mapping[str, str]):
+        bucket_hash = headers.get("X-RateLimit-Bucket")
+        if (
+            bucket_hash is not None
+            and self._bucket_hashes.get(route.key) != bucket_hash
+        ):
+            self._bucket_hashes[route.key] = bucket_hash
+            # This bucket is about to get the latest headers for the hash,
+            # so it replaces whatever another route registered under it.
+            self._buckets[(bucket_hash, route.major)] = bucket
+        bucket.update(headers)
+
+    def _rate_limited(
+        self, route: Route, bucket: Bucket, headers: Mapping[str, str], body: Dict
+    ) -> float:
+        retry_after = float(body.get("retry_after", headers.get("Retry-After", 1)))
+        self.stats.rate_limited += 1
+
+        if body.get("global") or headers.get("X-RateLimit-Global") == "true":
+            self.stats.global_rate_limited += 1
+            self._global_reset_at = max(
+                self._global_reset_at, time.monotonic() + retry_after
+            )
+            bucket.release()
+        else:
+            self._update(route, bucket, headers)
+            bucket.exhaust(retry_after)
+        return retry_after
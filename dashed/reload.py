@@ -0,0 +1,99 @@
+import asyncio
+import pathlib
+from typing import Dict, Iterable, List, Optional
+
+from dashed.loader import DashedContext, DashedModule, collect_modules, load_from_file
+from dashed.sync import schema_hash
+
+
+class Reloader:
+    def __init__(
+        self,
+        ctx: DashedContext,
+        modules: Iterable[DashedModule],
+        application_id: Optional[str] = None,
+        sync: bool = False,
+    ):
+        assert not sync or application_id, "syncing on reload needs an application id"
+        self.ctx = ctx
+        self.application_id = application_id
+        self.sync = sync
+
+        self._modules: Dict[pathlib.Path, DashedModule] = {
+            module.path: module for module in modules
+        }
+        self._lock = asyncio.Lock()
+
+    def changed(self) -> List[pathlib.Path]:
+        changed = []
+        for path, module in self._modules.items():
+            try:
+                mtime = path.stat().st_mtime
+            except OSError:
+                continue
+            if mtime != module.mtime:
+                changed.append(path)
+        return changed
+
+    async def reload(self, paths: Optional[Iterable[pathlib.Path]] = None) -> bool:
+        # Serialized so a signal arriving during a watcher reload can't build
+        # a table from a half-updated set of modules.
+        async with self._lock:
+            paths = list(self._modules) if paths is None else list(paths)
+            modules = dict(self._modules)
+            reloaded = []
+            failed = []
+            for path in paths:
+                try:
+                    modules[path] = await load_from_file(path)
+                except Exception as e:
+                    # Keep serving the last good version of the module, and
+                    # don't retry it until the file changes again.
+                    print(f"Failed to reload {path}: {e!r}")
+                    failed.append(path)
+                    try:
+                        self._modules[path].mtime = path.stat().st_mtime
+                    except OSError:
+                        pass
+                else:
+                    reloaded.append(path)
+
+            if not reloaded:
+                return False
+
+            previous_schema = schema_hash(self.ctx.get_application_command_schema())
+            self.ctx.swap(*collect_modules(modules.values()))
+            self.ctx.modules = list(modules.values())
+            self._modules = modules
+            print(
+                f"Reloaded {', '.join(str(path) for path in reloaded)}"
+                + (
+                    f", failed {', '.join(str(path) for path in failed)}"
+                    if failed
+                    else ""
+                )
+            )
+
+            if self.sync and (
+                schema_hash(self.ctx.get_application_command_schema())
+                != previous_schema
+            ):
+                try:
+                    result = await self.ctx.sync_commands(
+                        self.application_id, strategy="minimal"
+                    )
+                except Exception as e:
+                    print(f"Failed to sync commands after reload: {e!r}")
+                else:
+                    print(
+                        f"Synced commands: {len(result.created)} created, "
+                        f"{len(result.updated)} updated"
+                    )
+            return not failed
+
+    async def watch(self, interval: float = 1.0):
+        while True:
+            await asyncio.sleep(interval)
+            changed = self.changed()
+            if changed:
+                await self.reload(changed)
@@ -0,0 +1,168 @@
+import asyncio
+import dataclasses
+import itertools
+import time
+import traceback
+from typing import Awaitable, Callable, Dict, List, Optional
+
+
+class SchedulerFull(Exception):
+    pass
+
+
+@dataclasses.dataclass(order=True)
+class _Job:
+    sort_key: int
+    sequence: int
+    name: str = dataclasses.field(compare=False)
+    factory: Callable[[], Awaitable] = dataclasses.field(compare=False)
+    timeout: Optional[float] = dataclasses.field(compare=False)
+    submitted_at: float = dataclasses.field(compare=False)
+    started_at: Optional[float] = dataclasses.field(default=None, compare=False)
+
+
+@dataclasses.dataclass
+class SchedulerStats:
+    submitted: int = 0
+    completed: int = 0
+    failed: int = 0
+    timed_out: int = 0
+    rejected: int = 0
+    cancelled: int = 0
+
+
+def _print_error(name: str, error: BaseException):
+    print(f"Deferred task {name} failed:")
+    traceback.print_exception(type(error), error, error.__traceback__)
+
+
+class Scheduler:
+    def __init__(
+        self,
+        concurrency: int = 64,
+        max_queue: int = 1024,
+        default_timeout: Optional[float] = None,
+        on_error: Callable[[str, BaseException], None] = _print_error,
+    ):
+        self.concurrency = concurrency
+        self.max_queue = max_queue
+        self.default_timeout = default_timeout
+        self.on_error = on_error
+        self.stats = SchedulerStats()
+
+        self._queue: Optional[asyncio.PriorityQueue] = None
+        self._workers: List[asyncio.Task] = []
+        self._running: Dict[int, _Job] = {}
+        # When each queued job was submitted, in submission order
+        self._queued: Dict[int, float] = {}
+        self._sequence = itertools.count()
+        self._closed = False
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._running)
+
+    @property
+    def oldest_task_age(self) -> float:
+        now = time.monotonic()
+        return max((now - job.started_at for job in self._running.values()), default=0)
+
+    @property
+    def oldest_queued_age(self) -> float:
+        submitted_at = next(iter(self._queued.values()), None)
+        if submitted_at is None:
+            return 0.0
+        return time.monotonic() - submitted_at
+
+    def _start(self):
+        self._queue = asyncio.PriorityQueue(self.max_queue)
+        self._workers = [
+            asyncio.ensure_future(self._worker()) for _ in range(self.concurrency)
+        ]
+
+    def submit(
+        self,
+        factory: Callable[[], Awaitable],
+        *,
+        name: str = "task",
+        priority: int = 0,
+        timeout: Optional[float] = None,
+    ):
+        if self._closed:
+            self.stats.rejected += 1
+            raise SchedulerFull("scheduler is shutting down")
+
+        if self._queue is None:
+            self._start()
+
+        # Higher priorities run first, ties run in submission order
+        job = _Job(
+            sort_key=-priority,
+            sequence=next(self._sequence),
+            name=name,
+            factory=factory,
+            timeout=timeout if timeout is not None else self.default_timeout,
+            submitted_at=time.monotonic(),
+        )
+
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            self.stats.rejected += 1
+            raise SchedulerFull(f"scheduler queue is full ({self.max_queue} tasks)")
+        self._queued[job.sequence] = job.submitted_at
+        self.stats.submitted += 1
+
+    async def _run(self, job: _Job):
+        job.started_at = time.monotonic()
+        self._running[job.sequence] = job
+        try:
+            if job.timeout is None:
+                await job.factory()
+            else:
+                await asyncio.wait_for(job.factory(), job.timeout)
+        except asyncio.TimeoutError as e:
+            self.stats.timed_out += 1
+            self.on_error(job.name, e)
+        except asyncio.CancelledError:
+            self.stats.cancelled += 1
+            raise
+        except Exception as e:
+            self.stats.failed += 1
+            self.on_error(job.name, e)
+        else:
+            self.stats.completed += 1
+        finally:
+            del self._running[job.sequence]
+
+    async def _worker(self):
+        while True:
+            job = await self._queue.get()
+            del self._queued[job.sequence]
+            try:
+                await self._run(job)
+            finally:
+                self._queue.task_done()
+
+    async def drain(self, timeout: float):
+        self._closed = True
+        if self._queue is None:
+            return
+
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            print(
+                f"Scheduler drain timed out after {timeout}s with "
+                f"{self.in_flight} running and {self.queue_depth} queued tasks"
+            )
+
+        self.stats.cancelled += self.queue_depth
+        self._queued.clear()
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
@@ -0,0 +1,118 @@
+import dataclasses
+import typing
+from types import ModuleType
+from typing import Any, Callable, Dict, Union
+
+from dashed import discord, embeds
+
+_PRIMITIVES = (str, int, float, bool, type(None))
+
+# Generated encoders look each other up through this shared namespace at call
+# time, so the order in which dataclasses are compiled does not matter.
+_namespace: Dict[str, Any] = {}
+_encoders: Dict[type, Callable[[Any], Dict[str, Any]]] = {}
+
+
+def encode(value: Any) -> Any:
+    encoder = _encoders.get(type(value))
+    if encoder is not None:
+        return encoder(value)
+    elif isinstance(value, (list, tuple)):
+        return [encode(item) for item in value]
+    elif isinstance(value, dict):
+        return {k: encode(v) for k, v in value.items()}
+    return value
+
+
+def _unwrap_optional(type_: Any) -> Any:
+    if typing.get_origin(type_) is Union:
+        args = [arg for arg in typing.get_args(type_) if arg is not type(None)]
+        if len(args) == 1:
+            return args[0]
+    return type_
+
+
+def _is_primitive(type_: Any) -> bool:
+    type_ = _unwrap_optional(type_)
+    if typing.get_origin(type_) is typing.Literal:
+        return True
+    return isinstance(type_, type) and issubclass(type_, _PRIMITIVES)
+
+
+def _encoder_name(cls: type) -> str:
+    return f"_encode_{cls.__module__.replace('.', '_')}_{cls.__qualname__}"
+
+
+def _value_expression(type_: Any, expr: str) -> str:
+    if _is_primitive(type_):
+        return expr
+
+    type_ = _unwrap_optional(type_)
+    if dataclasses.is_dataclass(type_):
+        # Callers occasionally pass plain dicts where a dataclass is declared,
+        # so only take the specialized path on an exact type match.
+        class_name = f"{_encoder_name(type_)}_class"
+        _namespace[class_name] = type_
+        return (
+            f"({_encoder_name(type_)}({expr}) if type({expr}) is {class_name} "
+            f"else encode({expr}))"
+        )
+
+    if typing.get_origin(type_) in (list, typing.List):
+        (item_type,) = typing.get_args(type_) or (Any,)
+        if _is_primitive(item_type):
+            return f"list({expr})"
+        return f"[{_value_expression(item_type, '_item')} for _item in {expr}]"
+
+    return f"encode({expr})"
+
+
+def register(cls: type) -> Callable[[Any], Dict[str, Any]]:
+    if cls in _encoders:
+        return _encoders[cls]
+
+    hints = typing.get_type_hints(cls)
+    name = _encoder_name(cls)
+    lines = [f"def {name}(obj):", "    result = {}"]
+
+    for field in dataclasses.fields(cls):
+        lines.append(f"    value = obj.{field.name}")
+
+        if field.default is not dataclasses.MISSING and field.default is not None:
+            default_name = f"{name}_{field.name}_default"
+            _namespace[default_name] = field.default
+            condition = f"value is not None and value != {default_name}"
+        elif field.default_factory is not dataclasses.MISSING:
+            default_name = f"{name}_{field.name}_default"
+            _namespace[default_name] = field.default_factory()
+            condition = f"value is not None and value != {default_name}"
+        else:
+            condition = "value is not None"
+
+        lines.append(f"    if {condition}:")
+        lines.append(
+            f"        result[{field.name!r}] = "
+            f"{_value_expression(hints[field.name], 'value')}"
+        )
+
+    lines.append("    return result")
+    exec("\n".join(lines), _namespace)
+
+    encoder = _namespace[name]
+    _encoders[cls] = encoder
+    return encoder
+
+
+def _register_module(module: ModuleType):
+    for value in vars(module).values():
+        if (
+            isinstance(value, type)
+            and dataclasses.is_dataclass(value)
+            and value.__module__ == module.__name__
+        ):
+            register(value)
+
+
+_namespace["encode"] = encode
+_register_module(embeds)
+_register_module(discord)
@@ -1,104 +1,549 @@
 import asyncio
-import json
-from typing import Any, Dict, List
+import dataclasses
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
 
 from aiohttp import web
-from nacl.exceptions import BadSignatureError
 
+from dashed import codec
 from dashed.discord import (
-    ApplicationCommandOptionType,
-    Channel,
     InteractionRequestType,
     InteractionResponseType,
-    User,
+    MessageFlags,
+    WebhookEditBody,
 )
-from dashed.interaction import DeferredInteractionContext, InteractionContext
-from dashed.loader import DashedContext, _get_command_args
+from dashed.hooks import current_trace_id, new_trace_id, traced
+from dashed.interaction import (
+    ComponentContext,
+    DeferredComponentContext,
+    DeferredInteractionContext,
+    InteractionContext,
+)
+from dashed.loader import DashedContext, MissingOptionError, resolve_command_path
+from dashed.metrics import (
+    COMMAND_LATENCY,
+    DEADLINE_DEFERRED,
+    EXECUTOR_BUSY,
+    EXECUTOR_QUEUED,
+    EXECUTOR_WORKERS,
+    INTERACTIONS,
+    INVALID_INTERACTIONS,
+    REGISTRY,
+    SCHEDULER_IN_FLIGHT,
+    SCHEDULER_QUEUE_DEPTH,
+    STAGE_LATENCY,
+)
+from dashed.scheduler import SchedulerFull
+from dashed.verify import VerificationError
 
 
-def respond_json(data) -> web.Response:
-    return web.Response(
-        body=json.dumps(data).encode("utf-8"), content_type="application/json"
+class _EncodedReply(dict):
+    # A reply that was already serialized, for the response cache
+    def __init__(self, result: Dict[str, Any], body: bytes):
+        super().__init__(result)
+        self.body = body
+
+
+def _encode(ctx: DashedContext, data) -> bytes:
+    with STAGE_LATENCY.time(stage="serialize"), ctx.hooks.stage("serialize"):
+        return codec.dumps(data)
+
+
+def respond_json(ctx: DashedContext, data) -> web.Response:
+    if isinstance(data, _EncodedReply):
+        body = data.body
+    else:
+        body = _encode(ctx, data)
+    return web.Response(body=body, content_type="application/json")
+
+
+def _interaction_type_name(value: int) -> str:
+    try:
+        return InteractionRequestType(value).name.lower()
+    except ValueError:
+        return str(value)
+
+
+async def _timed_handler(ctx: DashedContext, path: str, awaitable):
+    started = time.perf_counter()
+    try:
+        with ctx.hooks.stage("handler", path):
+            return await awaitable
+    finally:
+        COMMAND_LATENCY.observe(time.perf_counter() - started, command=path)
+
+
+async def handle_interactions_request(request):
+    ctx = request.app["ctx"]
+    if not ctx.hooks.active:
+        return await _handle_interaction(ctx, request)
+    return await traced(new_trace_id(), _handle_traced_interaction(ctx, request))
+
+
+async def _handle_traced_interaction(ctx: DashedContext, request):
+    with ctx.hooks.stage("request"):
+        return await _handle_interaction(ctx, request)
+
+
+async def _handle_interaction(ctx: DashedContext, request):
+    # The response deadline counts from here, Discord's window includes
+    # verification and everything else before the handler.
+    started = time.perf_counter()
+    try:
+        with ctx.hooks.stage("verify"):
+            body = await ctx.verifier.read_verified_body(request)
+    except VerificationError as e:
+        return web.Response(text=e.reason, status=e.status)
+    finally:
+        STAGE_LATENCY.observe(time.perf_counter() - started, stage="verify")
+
+    with STAGE_LATENCY.time(stage="parse"), ctx.hooks.stage("parse"):
+        data = codec.loads(body)
+
+    INTERACTIONS.inc(type=_interaction_type_name(data["type"]))
+
+    if data["type"] == InteractionRequestType.PING:
+        return respond_json(ctx, {"type": InteractionResponseType.PONG})
+    elif ctx.recent_interactions is None or "id" not in data:
+        return await _dispatch_interaction(ctx, data, started)
+
+    # Discord delivers an interaction again when our response was slow or got
+    # lost. Repeats get the response to the first delivery (waiting for it if
+    # it is still running) instead of running the handler again.
+    status, body, content_type = await ctx.recent_interactions.get_or_compute(
+        data["id"], lambda: _encoded_response(ctx, data, started)
     )
+    if status >= 500:
+        ctx.recent_interactions.invalidate(data["id"])
+    return web.Response(status=status, body=body, content_type=content_type)
 
 
-def _get_options_data(
-    command_data: Dict[str, Any], options: List[Any]
-) -> Dict[str, Any]:
-    result = {}
+async def _encoded_response(ctx: DashedContext, data, received: float):
+    response = await _dispatch_interaction(ctx, data, received)
+    return response.status, response.body, response.content_type
 
-    for option in options:
-        if option["type"] == ApplicationCommandOptionType.CHANNEL:
-            result[option["name"]] = Channel(
-                **command_data["resolved"]["channels"][option["value"]]
-            )
-        elif option["type"] == ApplicationCommandOptionType.USER:
-            result[option["name"]] = User(
-                **command_data["resolved"]["users"][option["value"]]
-            )
-        else:
-            result[option["name"]] = option["value"]
+
+async def _dispatch_interaction(ctx: DashedContext, data, received: float):
+    try:
+        if data["type"] == InteractionRequestType.APPLICATION_COMMAND:
+            return await _handle_command(ctx, data, received)
+        elif data["type"] == InteractionRequestType.MESSAGE_COMPONENT:
+            return await _handle_component(ctx, data)
+        elif data["type"] == InteractionRequestType.APPLICATION_COMMAND_AUTOCOMPLETE:
+            return await _handle_autocomplete(ctx, data)
+    except SchedulerFull:
+        # Raised by handlers calling ctx.defer() while the scheduler is full
+        return web.Response(text="too many deferred tasks", status=503)
+
+    return respond_json(ctx, {})
+
+
+async def _run_in_pool(ctx: DashedContext, target, context, args):
+    fn = target.fn
+    resolve = getattr(fn, "resolve", None)
+    if resolve is not None:
+        fn = await resolve()
+    return await ctx.pools.get(target.executor).run(fn, context, args)
+
+
+def _call(ctx: DashedContext, target, context, args):
+    if target.executor is None:
+        return target.fn(context, **args)
+    return _run_in_pool(ctx, target, context, args)
+
+
+def _call_deferred(ctx: DashedContext, target, deferred_context, args):
+    if target.streaming:
+        return deferred_context.consume(target.fn(deferred_context, **args))
+    elif target.executor is not None:
+        # Pool handlers can't await update(), whatever reply they return is
+        # delivered as an edit instead.
+        return _reply_when_done(
+            ctx,
+            deferred_context.data,
+            _run_in_pool(ctx, target, deferred_context, args),
+        )
+    return target.fn(deferred_context, **args)
+
+
+def _submit_deferred(ctx: DashedContext, name, target, deferred_context, args):
+    trace_id = current_trace_id()
+    ctx.scheduler.submit(
+        lambda: traced(
+            trace_id,
+            _timed_handler(
+                ctx, name, _call_deferred(ctx, target, deferred_context, args)
+            ),
+        ),
+        name=name,
+        priority=target.priority,
+        timeout=target.timeout,
+    )
+
+
+_WEBHOOK_EDIT_FIELDS = frozenset(
+    field.name for field in dataclasses.fields(WebhookEditBody)
+)
+
+
+_REPLY_TYPES = (
+    InteractionResponseType.CHANNEL_MESSAGE_WITH_SOURCE,
+    InteractionResponseType.UPDATE_MESSAGE,
+)
+
+
+async def _reply_when_done(ctx: DashedContext, data, task: Awaitable):
+    result = await task
+
+    # Handlers that called defer() themselves already update the response
+    if not isinstance(result, dict) or result.get("type") not in _REPLY_TYPES:
+        return
+
+    await ctx.client.edit_original_interaction_response(
+        data["application_id"],
+        data["token"],
+        {k: v for k, v in result.get("data", {}).items() if k in _WEBHOOK_EDIT_FIELDS},
+        files=result.get("files"),
+    )
+
+
+def _has_files(result) -> bool:
+    return isinstance(result, dict) and bool(result.get("files"))
+
+
+async def _cache_reply(ctx: DashedContext, cache, key: str, handler: Awaitable):
+    result = await handler
+    if (
+        isinstance(result, dict)
+        and result.get("type") == InteractionResponseType.CHANNEL_MESSAGE_WITH_SOURCE
+        and not _has_files(result)
+    ):
+        result = _EncodedReply(result, _encode(ctx, result))
+        await cache.set(key, result.body)
     return result
 
 
-async def handle_interactions_request(request):
-    signature = request.headers.get("X-Signature-Ed25519")
-    timestamp = request.headers.get("X-Signature-Timestamp")
+def _deferred_response(flags: Optional[int]):
+    response = {"type": InteractionResponseType.DEFERRED_CHANNEL_MESSAGE_WITH_SOURCE}
+    if flags:
+        # The later edit can't make the message ephemeral, the deferred
+        # response has to.
+        response["data"] = {"flags": flags}
+    return response
+
 
-    body = await request.read()
+def _command_flags(command) -> Optional[int]:
+    return MessageFlags.EPHEMERAL if command.ephemeral else None
 
+
+async def _flag_reply(handler: Awaitable, flags: int):
+    # The command's flags apply to a reply sent right away as well, not only
+    # to one that missed the deadline and went out deferred.
+    result = await handler
+    if (
+        isinstance(result, dict)
+        and result.get("type") == InteractionResponseType.CHANNEL_MESSAGE_WITH_SOURCE
+    ):
+        data = result.get("data") or {}
+        result = dict(result, data=dict(data, flags=(data.get("flags") or 0) | flags))
+    return result
+
+
+async def _handle_command(ctx: DashedContext, data, received: float):
+    started = time.perf_counter()
+    command_data = data["data"]
+
+    with ctx.hooks.stage("dispatch"):
+        path, options_data = resolve_command_path(command_data)
+        compiled = ctx.dispatch.get(path)
+        if compiled is None:
+            INVALID_INTERACTIONS.inc(reason="unknown_command")
+            return web.Response(text="unknown command", status=400)
+
+        target_command = compiled.command
+        try:
+            args = compiled.decode(command_data.get("resolved", {}), options_data)
+        except MissingOptionError as e:
+            INVALID_INTERACTIONS.inc(reason="invalid_options")
+            return web.Response(text=str(e), status=400)
+
+        interaction_context = InteractionContext(ctx, data)
+
+    if target_command.deferred:
+        try:
+            _submit_deferred(
+                ctx,
+                compiled.path,
+                target_command,
+                DeferredInteractionContext(interaction_context),
+                args,
+            )
+        except SchedulerFull:
+            return web.Response(text="too many deferred tasks", status=503)
+        finally:
+            STAGE_LATENCY.observe(time.perf_counter() - started, stage="dispatch")
+
+        return respond_json(ctx, _deferred_response(_command_flags(target_command)))
+
+    cache = target_command.cache
+    if cache is not None:
+        key = cache.key(data, args)
+        body = await cache.get(key)
+        if body is not None:
+            STAGE_LATENCY.observe(time.perf_counter() - started, stage="dispatch")
+            return web.Response(body=body, content_type="application/json")
+
+    STAGE_LATENCY.observe(time.perf_counter() - started, stage="dispatch")
+    handler = _timed_handler(
+        ctx, compiled.path, _call(ctx, target_command, interaction_context, args)
+    )
+    flags = _command_flags(target_command)
+    if flags is not None:
+        handler = _flag_reply(handler, flags)
+    if cache is not None:
+        handler = _cache_reply(ctx, cache, key, handler)
+
+    deadline = ctx.response_deadline
+    if deadline is not None:
+        deadline = max(0.0, deadline - (time.perf_counter() - received))
+
+    task = asyncio.ensure_future(handler)
+    try:
+        await asyncio.wait((task,), timeout=deadline)
+    except asyncio.CancelledError:
+        task.cancel()
+        raise
+
+    if task.done() and not _has_files(task.result()):
+        return respond_json(ctx, task.result())
+
+    # The handler is too slow to answer inside Discord's window (or replied
+    # with files, which can only be uploaded by editing the response), so
+    # acknowledge the interaction now and deliver its reply as an edit.
+    trace_id = current_trace_id()
     try:
-        request.app["ctx"].application_key.verify(
-            timestamp.encode("utf-8") + body, bytes.fromhex(signature)
+        ctx.scheduler.submit(
+            lambda: traced(trace_id, _reply_when_done(ctx, data, task)),
+            name=compiled.path,
+            priority=target_command.priority,
+            timeout=target_command.timeout,
         )
-    except BadSignatureError:
-        return web.Response(text="bad signature", status=400)
+    except SchedulerFull:
+        result = await task
+        if _has_files(result):
+            return web.Response(text="too many deferred tasks", status=503)
+        return respond_json(ctx, result)
 
-    data = json.loads(body)
+    if task.done():
+        flags = task.result().get("data", {}).get("flags") or _command_flags(
+            target_command
+        )
+    else:
+        flags = _command_flags(target_command)
+        DEADLINE_DEFERRED.inc(command=compiled.path)
+    return respond_json(ctx, _deferred_response(flags))
 
-    if data["type"] == InteractionRequestType.PING:
-        return respond_json({"type": InteractionResponseType.PONG})
-    elif data["type"] == InteractionRequestType.APPLICATION_COMMAND:
-        command_data = data["data"]
-
-        target_command = None
-        options_data = None
-        if command_data["name"] in request.app["ctx"].commands:
-            target_command = request.app["ctx"].commands[command_data["name"]]
-            options_data = command_data.get("options", [])
-        elif command_data["name"] in request.app["ctx"].groups:
-            target_command, options_data = (
-                request.app["ctx"]
-                .groups[command_data["name"]]
-                .lookup(command_data["options"])
+
+async def _handle_component(ctx: DashedContext, data):
+    started = time.perf_counter()
+    custom_id = data["data"]["custom_id"]
+
+    with ctx.hooks.stage("dispatch"):
+        try:
+            match = ctx.router.match(custom_id)
+        except ValueError:
+            match = None
+        if match is None:
+            INVALID_INTERACTIONS.inc(reason="unknown_component")
+            return web.Response(text="unknown component", status=400)
+
+        compiled, args = match
+        target_component = compiled.component
+        component_context = ComponentContext(ctx, data, compiled.pattern)
+
+    if target_component.deferred:
+        try:
+            _submit_deferred(
+                ctx,
+                compiled.pattern,
+                target_component,
+                DeferredComponentContext(component_context),
+                args,
             )
-        else:
-            print("No target command", data)
-            return web.Response(text="unknown command", status=400)
+        except SchedulerFull:
+            return web.Response(text="too many deferred tasks", status=503)
+        finally:
+            STAGE_LATENCY.observe(time.perf_counter() - started, stage="dispatch")
+
+        return respond_json(
+            ctx, {"type": InteractionResponseType.DEFERRED_UPDATE_MESSAGE}
+        )
+
+    STAGE_LATENCY.observe(time.perf_counter() - started, stage="dispatch")
+    result = await _timed_handler(
+        ctx, compiled.pattern, _call(ctx, target_component, component_context, args)
+    )
+    return respond_json(ctx, result)
+
+
+async def _handle_autocomplete(ctx: DashedContext, data):
+    started = time.perf_counter()
+    with ctx.hooks.stage("dispatch"):
+        path, options_data = resolve_command_path(data["data"])
+        compiled = ctx.dispatch.get(path)
+
+        focused = next((o for o in options_data if o.get("focused")), None)
+        autocomplete = (
+            compiled.autocomplete.get(focused["name"])
+            if compiled is not None and focused is not None
+            else None
+        )
+        if autocomplete is None:
+            INVALID_INTERACTIONS.inc(reason="unknown_autocomplete")
+            return web.Response(text="unknown autocomplete option", status=400)
+
+    STAGE_LATENCY.observe(time.perf_counter() - started, stage="dispatch")
+    choices = await _timed_handler(
+        ctx,
+        f"{path} {focused['name']}",
+        autocomplete.complete(
+            InteractionContext(ctx, data), path, focused["name"], focused["value"]
+        ),
+    )
+    return respond_json(
+        ctx,
+        {
+            "type": InteractionResponseType.APPLICATION_COMMAND_AUTOCOMPLETE_RESULT,
+            "data": {"choices": choices},
+        },
+    )
+
+
+# The Prometheus text exposition format
+_METRICS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+async def handle_metrics_request(request):
+    return web.Response(
+        body=REGISTRY.render().encode("utf-8"),
+        headers={"Content-Type": _METRICS_CONTENT_TYPE},
+    )
 
-        options = _get_options_data(command_data, options_data)
-        args = {k: options[k] for k in _get_command_args(target_command).keys()}
 
-        interaction_context = InteractionContext(request.app["ctx"], data)
+async def handle_ready_request(request):
+    if not request.app["ready"]:
+        return web.Response(text="not ready", status=503)
+    return web.Response(text="ready")
 
-        if target_command.deferred:
-            asyncio.ensure_future(
-                target_command.fn(
-                    DeferredInteractionContext(interaction_context), **args
-                )
+
+async def _warm_up(app):
+    # Runs once the server is listening, /ready only reports ready after it,
+    # so the first wave of deferred responses doesn't pay for connection
+    # setup and TLS handshakes.
+    await app["listening"].wait()
+    if app["warm_up_connections"] > 0:
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(
+                app["ctx"].client.warm_up(app["warm_up_connections"]),
+                app["warm_up_timeout"],
             )
-            return respond_json(
-                {"type": InteractionResponseType.DEFERRED_CHANNEL_MESSAGE_WITH_SOURCE}
+        except asyncio.TimeoutError:
+            print("Discord API warm-up timed out")
+        else:
+            print(
+                f"Warmed up {app['warm_up_connections']} Discord API connections "
+                f"in {time.perf_counter() - started:.2f}s"
             )
+    app["ready"] = True
+    if app["started_at"] is not None:
+        print(f"Ready in {time.perf_counter() - app['started_at']:.2f}s")
+    if app["on_ready"] is not None:
+        app["on_ready"]()
+
+    # Modules skipped at startup thanks to the manifest are imported (and
+    # initialized) now, rather than inside the first request that uses them.
+    # The import runs in a thread and modules load one at a time, so requests
+    # keep being served in between.
+    for module in app["ctx"].modules:
+        if module.load is not None:
+            try:
+                await module.load()
+            except Exception as e:
+                print(f"Failed to load {module.path}: {e!r}")
+            await asyncio.sleep(0)
+
+
+async def _start_warm_up(app):
+    # on_startup runs before the socket is bound, the task waits for it
+    app["warm_up"] = asyncio.ensure_future(_warm_up(app))
+
+
+async def _not_ready(app):
+    app["ready"] = False
+    app["warm_up"].cancel()
 
-        result = await target_command.fn(interaction_context, **args)
-        return respond_json(result)
 
-    return respond_json({})
+async def _drain_scheduler(app):
+    await app["ctx"].scheduler.drain(app["drain_timeout"])
 
 
-async def run(host: str, port: int, ctx: DashedContext):
+async def run(
+    host: str,
+    port: int,
+    ctx: DashedContext,
+    drain_timeout: float = 30.0,
+    shutdown_timeout: float = 60.0,
+    reuse_port: bool = False,
+    metrics: bool = False,
+    warm_up_connections: int = 0,
+    warm_up_timeout: float = 10.0,
+    started_at: Optional[float] = None,
+    on_ready: Optional[Callable[[], None]] = None,
+):
     app = web.Application()
     app["ctx"] = ctx
-    app.add_routes([web.post("/interactions", handle_interactions_request)])
-    await web._run_app(app, host=host, port=port)
+    app["ready"] = False
+    app["drain_timeout"] = drain_timeout
+    app["warm_up_connections"] = warm_up_connections
+    app["warm_up_timeout"] = warm_up_timeout
+    app["started_at"] = started_at
+    app["on_ready"] = on_ready
+    app["listening"] = asyncio.Event()
+    app.on_startup.append(_start_warm_up)
+    app.on_shutdown.append(_not_ready)
+    app.on_shutdown.append(_drain_scheduler)
+    app.add_routes(
+        [
+            web.post("/interactions", handle_interactions_request),
+            web.get("/ready", handle_ready_request),
+        ]
+    )
+
+    if metrics:
+        SCHEDULER_QUEUE_DEPTH.set_function(lambda: ctx.scheduler.queue_depth)
+        SCHEDULER_IN_FLIGHT.set_function(lambda: ctx.scheduler.in_flight)
+        for pool in ctx.pools:
+            EXECUTOR_WORKERS.set_function(
+                lambda pool=pool: pool.max_workers, executor=pool.kind
+            )
+            EXECUTOR_BUSY.set_function(lambda pool=pool: pool.busy, executor=pool.kind)
+            EXECUTOR_QUEUED.set_function(
+                lambda pool=pool: pool.queued, executor=pool.kind
+            )
+        app.add_routes([web.get("/metrics", handle_metrics_request)])
+
+    def listening(*args):
+        # run_app prints its startup message once every site is bound
+        if not reuse_port:
+            print(*args)
+        app["listening"].set()
+
+    await web._run_app(
+        app,
+        host=host,
+        port=port,
+        shutdown_timeout=shutdown_timeout,
+        reuse_port=reuse_port,
+        print=listening,
+    )
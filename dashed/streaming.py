@@ -0,0 +1,79 @@
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+
+class ResponseStream:
+    # Collapses a stream of message states into as few edits as possible:
+    # only the most recent state is ever sent, no more often than every
+    # `interval` seconds, and never into a rate limit we already know about.
+    def __init__(
+        self,
+        send: Callable[[Dict[str, Any]], Awaitable[Any]],
+        delay: Callable[[], float] = lambda: 0.0,
+        interval: float = 1.0,
+    ):
+        self.interval = interval
+        self.pushed = 0
+        self.sent = 0
+
+        self._send = send
+        self._delay = delay
+        self._latest: Optional[Dict[str, Any]] = None
+        self._next_send_at = 0.0
+        self._wake = asyncio.Event()
+        self._closing = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def push(self, body: Dict[str, Any]):
+        assert not self._closing.is_set(), "stream is closed"
+        self._latest = body
+        self.pushed += 1
+        self._wake.set()
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._run())
+
+    async def _wait(self, delay: float):
+        try:
+            await asyncio.wait_for(self._closing.wait(), delay)
+        except asyncio.TimeoutError:
+            pass
+
+    async def _run(self):
+        while True:
+            await self._wake.wait()
+            self._wake.clear()
+            if self._latest is None:
+                if self._closing.is_set():
+                    return
+                continue
+
+            # The final state is sent straight away, the client still waits
+            # for the bucket if it has to.
+            if not self._closing.is_set():
+                delay = max(self._next_send_at - time.monotonic(), self._delay())
+                if delay > 0:
+                    await self._wait(delay)
+
+            body, self._latest = self._latest, None
+            self._next_send_at = time.monotonic() + self.interval
+            await self._send(body)
+            self.sent += 1
+
+            if self._closing.is_set() and self._latest is None:
+                return
+
+    async def close(self):
+        self._closing.set()
+        self._wake.set()
+        if self._task is not None:
+            await self._task
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        if exc_type is asyncio.CancelledError and self._task is not None:
+            self._task.cancel()
+        else:
+            await self.close()
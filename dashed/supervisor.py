@@ -0,0 +1,188 @@
+import multiprocessing
+import os
+import signal
+import time
+from typing import Any, Callable, List, Optional, Tuple
+
+# Workers inherit the loaded interpreter state, there is no need to pay for
+# re-importing everything in each child.
+_mp = multiprocessing.get_context("fork")
+
+# Set by a worker once it serves requests, see notify_ready
+_ready: Optional[Any] = None
+
+
+def notify_ready():
+    # Lets the supervisor retire the worker this one replaces. A no-op when
+    # the server doesn't run under a supervisor.
+    if _ready is not None:
+        _ready.set()
+
+
+def _worker_main(target: Callable[[int], None], index: int, ready):
+    global _ready
+    _ready = ready
+    # The supervisor owns reloads and terminal interrupts, workers only react
+    # to the SIGTERM it sends them.
+    signal.signal(signal.SIGHUP, signal.SIG_IGN)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    # Until the worker installs its reload handler a forwarded SIGUSR1 must
+    # not kill it.
+    signal.signal(signal.SIGUSR1, signal.SIG_IGN)
+    target(index)
+
+
+class _Worker:
+    def __init__(self, process: multiprocessing.Process, ready):
+        self.process = process
+        self.ready = ready
+        self.started_at = time.monotonic()
+
+
+class Supervisor:
+    def __init__(
+        self,
+        # Called with the worker's slot, which a replacement worker inherits
+        target: Callable[[int], None],
+        workers: int,
+        shutdown_timeout: float = 60.0,
+        restart_delay: float = 1.0,
+        max_restart_delay: float = 30.0,
+        ready_timeout: float = 60.0,
+    ):
+        self.target = target
+        self.workers = workers
+        self.shutdown_timeout = shutdown_timeout
+        self.restart_delay = restart_delay
+        self.max_restart_delay = max_restart_delay
+        self.ready_timeout = ready_timeout
+
+        self._slots: List[Optional[_Worker]] = [None] * workers
+        self._crashes = [0] * workers
+        self._restart_at = [0.0] * workers
+        self._stopping = False
+        self._recycle = False
+        # Slots still to be recycled, the slot whose replacement is starting
+        # (with the old worker and a deadline) and the old worker stopping
+        self._recycling: List[int] = []
+        self._replacing: Optional[Tuple[int, Optional[_Worker], float]] = None
+        self._retiring: Optional[Tuple[_Worker, float]] = None
+
+    def _spawn(self, index: int) -> _Worker:
+        ready = _mp.Event()
+        process = _mp.Process(
+            target=_worker_main, args=(self.target, index, ready), daemon=False
+        )
+        process.start()
+        print(f"Started worker {process.pid}")
+        return _Worker(process, ready)
+
+    def _stop(self, worker: _Worker, timeout: float):
+        if worker.process.is_alive():
+            worker.process.terminate()
+        worker.process.join(timeout)
+        if worker.process.is_alive():
+            print(f"Worker {worker.process.pid} did not exit in time, killing it")
+            worker.process.kill()
+            worker.process.join()
+
+    def _handle_stop(self, signum, frame):
+        self._stopping = True
+
+    def _handle_hup(self, signum, frame):
+        self._recycle = True
+
+    def _handle_usr1(self, signum, frame):
+        # Workers reload their command modules in place
+        for worker in self._slots:
+            if worker is not None and worker.process.is_alive():
+                os.kill(worker.process.pid, signal.SIGUSR1)
+
+    def _recycle_workers(self):
+        # Runs a step at a time from the supervisor loop, which keeps reaping
+        # and restarting crashed workers while old ones finish their requests.
+        if self._retiring is not None:
+            old, deadline = self._retiring
+            if old.process.is_alive() and time.monotonic() < deadline:
+                return
+            self._stop(old, 0)
+            self._retiring = None
+
+        if self._replacing is not None:
+            # The old worker keeps serving until its replacement is listening
+            # and ready (a crashed replacement is restarted by _reap).
+            index, old, deadline = self._replacing
+            new = self._slots[index]
+            ready = new is not None and new.ready.is_set()
+            if not ready and time.monotonic() < deadline:
+                return
+            if not ready:
+                print(f"Worker for slot {index} not ready in time, replacing anyway")
+            self._replacing = None
+            if old is not None:
+                old.process.terminate()
+                self._retiring = (old, time.monotonic() + self.shutdown_timeout)
+            return
+
+        if self._recycling:
+            # Bring the replacement up first so the port always has a
+            # listener, the old worker is only stopped once it is ready.
+            index = self._recycling.pop(0)
+            old = self._slots[index]
+            self._slots[index] = self._spawn(index)
+            self._replacing = (index, old, time.monotonic() + self.ready_timeout)
+
+    def _reap(self):
+        now = time.monotonic()
+        for index, worker in enumerate(self._slots):
+            if worker is not None and not worker.process.is_alive():
+                print(
+                    f"Worker {worker.process.pid} exited with code "
+                    f"{worker.process.exitcode}"
+                )
+                # Back off when a worker keeps crashing right after startup
+                if now - worker.started_at < self.max_restart_delay:
+                    self._crashes[index] += 1
+                else:
+                    self._crashes[index] = 0
+                self._restart_at[index] = now + min(
+                    self.restart_delay * 2 ** (self._crashes[index] - 1),
+                    self.max_restart_delay,
+                )
+                self._slots[index] = None
+
+            if self._slots[index] is None and now >= self._restart_at[index]:
+                self._slots[index] = self._spawn(index)
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self._handle_stop)
+        signal.signal(signal.SIGINT, self._handle_stop)
+        signal.signal(signal.SIGHUP, self._handle_hup)
+        signal.signal(signal.SIGUSR1, self._handle_usr1)
+
+        print(f"Supervisor {os.getpid()} starting {self.workers} workers")
+        self._slots = [self._spawn(index) for index in range(self.workers)]
+
+        while not self._stopping:
+            time.sleep(0.2)
+            if self._recycle:
+                self._recycle = False
+                self._recycling = list(range(self.workers))
+                print("Recycling workers")
+            if not self._stopping:
+                self._reap()
+                self._recycle_workers()
+
+        print("Stopping workers")
+        workers = [worker for worker in self._slots if worker is not None]
+        if self._replacing is not None and self._replacing[1] is not None:
+            workers.append(self._replacing[1])
+        if self._retiring is not None:
+            workers.append(self._retiring[0])
+        for worker in workers:
+            if worker.process.is_alive():
+                worker.process.terminate()
+
+        deadline = time.monotonic() + self.shutdown_timeout
+        for worker in workers:
+            self._stop(worker, max(deadline - time.monotonic(), 0))
@@ -0,0 +1,245 @@
+import asyncio
+import contextlib
+import dataclasses
+import functools
+import hashlib
+import json
+import pathlib
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from dashed.discord import DiscordAPIClient
+
+DEFAULT_SCHEMA_CACHE_PATH = pathlib.Path(".dashed-schema-cache.json")
+
+
+@dataclasses.dataclass
+class SyncResult:
+    created: List[str] = dataclasses.field(default_factory=list)
+    updated: List[str] = dataclasses.field(default_factory=list)
+    deleted: List[str] = dataclasses.field(default_factory=list)
+    unchanged: List[str] = dataclasses.field(default_factory=list)
+    cached: bool = False
+
+    @property
+    def changed(self) -> bool:
+        return bool(self.created or self.updated or self.deleted)
+
+
+def _normalize_option(option: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "type": int(option["type"]),
+        "name": option["name"],
+        "description": option["description"],
+        "required": option.get("required", False),
+        "choices": [
+            {"name": choice["name"], "value": choice["value"]}
+            for choice in option.get("choices") or []
+        ],
+        "options": [_normalize_option(child) for child in option.get("options") or []],
+        "autocomplete": option.get("autocomplete", False),
+    }
+
+
+def normalize_command(command: Dict[str, Any]) -> Dict[str, Any]:
+    # Only compare the fields we control, Discord's copy also carries ids and
+    # versions and omits default values.
+    return {
+        "name": command["name"],
+        "description": command["description"],
+        "options": [
+            _normalize_option(option) for option in command.get("options") or []
+        ],
+        "default_permission": command.get("default_permission", True),
+    }
+
+
+def schema_hash(schema: List[Dict[str, Any]]) -> str:
+    normalized = sorted((normalize_command(c) for c in schema), key=lambda c: c["name"])
+    return hashlib.sha256(
+        json.dumps(normalized, sort_keys=True, separators=(",", ":")).encode("utf-8")
+    ).hexdigest()
+
+
+class SchemaCache:
+    def __init__(self, path: pathlib.Path = DEFAULT_SCHEMA_CACHE_PATH):
+        self.path = path
+        self._data: Optional[Dict[str, str]] = None
+        self._batching = False
+
+    def _load(self) -> Dict[str, str]:
+        if self._data is None:
+            try:
+                self._data = json.loads(self.path.read_text())
+            except (FileNotFoundError, ValueError):
+                self._data = {}
+        return self._data
+
+    def get(self, key: str) -> Optional[str]:
+        return self._load().get(key)
+
+    def set(self, key: str, value: str):
+        self._load()[key] = value
+        if not self._batching:
+            self.flush()
+
+    def flush(self):
+        if self._data is not None:
+            self.path.write_text(json.dumps(self._data, indent=2, sort_keys=True))
+
+    @contextlib.contextmanager
+    def batch(self):
+        # Writes the file once at the end instead of after every set()
+        self._batching = True
+        try:
+            yield
+        finally:
+            self._batching = False
+            self.flush()
+
+
+class _Endpoints:
+    # Global and guild commands have the same endpoints, guild ones just take
+    # the guild id as well.
+    def __init__(
+        self, client: DiscordAPIClient, application_id: str, guild_id: Optional[str]
+    ):
+        partial = functools.partial
+        if guild_id is None:
+            self.get = partial(client.get_global_application_commands, application_id)
+            self.create = partial(
+                client.create_global_application_command, application_id
+            )
+            self.edit = partial(client.edit_global_application_command, application_id)
+            self.bulk_overwrite = partial(
+                client.bulk_overwrite_global_application_commands, application_id
+            )
+            self.delete = partial(
+                client.delete_global_application_command, application_id
+            )
+        else:
+            scope = (application_id, guild_id)
+            self.get = partial(client.get_guild_application_commands, *scope)
+            self.create = partial(client.create_guild_application_command, *scope)
+            self.edit = partial(client.edit_guild_application_command, *scope)
+            self.bulk_overwrite = partial(
+                client.bulk_overwrite_guild_application_commands, *scope
+            )
+            self.delete = partial(client.delete_guild_application_command, *scope)
+
+
+async def sync_commands(
+    client: DiscordAPIClient,
+    application_id: str,
+    schema: List[Dict[str, Any]],
+    strategy: str = "bulk",
+    delete_unknown: bool = False,
+    cache: Optional[SchemaCache] = None,
+    guild_id: Optional[str] = None,
+) -> SyncResult:
+    assert strategy in ("bulk", "minimal"), f"unknown sync strategy {strategy!r}"
+
+    result = SyncResult()
+    desired_hash = schema_hash(schema)
+    scope = (
+        f"global:{application_id}"
+        if guild_id is None
+        else f"guild:{application_id}:{guild_id}"
+    )
+    # The same schema synced with other options leaves other commands behind
+    cache_key = f"{scope}:{strategy}:{'delete' if delete_unknown else 'keep'}"
+    endpoints = _Endpoints(client, application_id, guild_id)
+
+    if cache is not None and cache.get(cache_key) == desired_hash:
+        result.cached = True
+        result.unchanged = [command["name"] for command in schema]
+        return result
+
+    existing = {command["name"]: command for command in await endpoints.get()}
+
+    for command in schema:
+        current = existing.get(command["name"])
+        if current is None:
+            result.created.append(command["name"])
+        elif normalize_command(current) != normalize_command(command):
+            result.updated.append(command["name"])
+        else:
+            result.unchanged.append(command["name"])
+
+    desired_names = {command["name"] for command in schema}
+    unknown = [name for name in existing if name not in desired_names]
+
+    if strategy == "bulk":
+        # A bulk overwrite is authoritative, anything not in the body is
+        # removed by Discord. Unknown commands are sent back as they are
+        # unless they should be deleted.
+        if delete_unknown:
+            result.deleted = unknown
+        if result.changed:
+            await endpoints.bulk_overwrite(
+                schema + [existing[name] for name in unknown if not delete_unknown]
+            )
+    else:
+        for command in schema:
+            if command["name"] in result.created:
+                await endpoints.create(command)
+            elif command["name"] in result.updated:
+                await endpoints.edit(existing[command["name"]]["id"], command)
+
+        if delete_unknown:
+            result.deleted = unknown
+            for name in unknown:
+                await endpoints.delete(existing[name]["id"])
+
+    if cache is not None:
+        cache.set(cache_key, desired_hash)
+
+    return result
+
+
+@dataclasses.dataclass
+class GuildSyncResult:
+    guild_id: str
+    result: Optional[SyncResult] = None
+    error: Optional[BaseException] = None
+
+
+async def sync_guild_commands(
+    client: DiscordAPIClient,
+    application_id: str,
+    guild_ids: Iterable[str],
+    schema: List[Dict[str, Any]],
+    strategy: str = "bulk",
+    delete_unknown: bool = False,
+    cache: Optional[SchemaCache] = None,
+    concurrency: int = 8,
+    on_result: Optional[Callable[[GuildSyncResult], None]] = None,
+) -> List[GuildSyncResult]:
+    # Every guild has its own rate limit buckets, so guilds are synced
+    # concurrently and the client's rate limiter keeps each of them (and the
+    # global limit) in check. A failing guild doesn't stop the others.
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def sync_guild(guild_id: str) -> GuildSyncResult:
+        async with semaphore:
+            try:
+                outcome = GuildSyncResult(
+                    guild_id,
+                    result=await sync_commands(
+                        client,
+                        application_id,
+                        schema,
+                        strategy=strategy,
+                        delete_unknown=delete_unknown,
+                        cache=cache,
+                        guild_id=guild_id,
+                    ),
+                )
+            except Exception as e:
+                outcome = GuildSyncResult(guild_id, error=e)
+
+        if on_result is not None:
+            on_result(outcome)
+        return outcome
+
+    with cache.batch() if cache is not None else contextlib.nullcontext():
+        return list(await asyncio.gather(*(sync_guild(g) for g in guild_ids)))